@@ -30,14 +30,42 @@ from __future__ import print_function
 
 import sys
 import os
-import argparse
-
-import myhdl
-
+import time
+import shutil
+import tempfile
+import threading
+
+# MyHDL and argparse are imported when needed, so Qsys' Elaborate call doesn't pay for them
+# the performance log reports what the imports below took, timed here as a worker process imports only once
+importstart = time.time()
+import Utilities.Qgen.fastpath as fastpath
 import Utilities.Qgen.generics as generics
 import Utilities.Qgen.connectionpoints as connectionpoints
 import Utilities.Qgen.generate as generate
+import Utilities.Qgen.expression as expression
+import Utilities.Qgen.speculate as speculate
+import Utilities.Qgen.cache as cache
+import Utilities.Qgen.perflog as perflogging
 import Utilities.Qgen.qerror as qerror
+# taken by the first call this process logs
+importseconds = [time.time() - importstart]
+
+
+
+def importtime(withmyhdl=True):
+    ''' the seconds this call spends importing: Qgen's own modules if it is the first call in this process,
+        and MyHDL unless it was imported already (by the component or an earlier call)
+    '''
+    seconds = importseconds.pop() if importseconds else 0.0
+    if withmyhdl:
+        start = time.time()
+        import myhdl
+        seconds += time.time() - start
+    return seconds
+
+
+# held while MyHDL converts, its settings (toVHDL.name, .directory, ...) belong to the whole process
+myhdllock = threading.RLock()
 
 
 class Qgen(object):
@@ -51,14 +79,61 @@ class Qgen(object):
                  connectionpointlist=None,
                  testbench=None,  # args: (time, tb_modulename)
                  convert=None,  # args: (targetHDL) -- 'vhdl' or 'verilog'
-                 elaborate=None,  # args: [PARAM1 value1 PARAM2 value2 ...]
-                 gentcl=False  # args: version, author, group
+                 elaborate=None,  # args: [PARAM1 value1 PARAM2 value2 ...], or 'module:function'
+                 gentcl=False,  # args: version, author, group [, {writeHwTcl options}]
+                 elaboratecache=None,  # args: maximum number of entries in the persistent elaborate cache
+                 perflog=None,  # args: True to log every Qsys call to <modulename>.perf.jsonl, or the path
+                 generatecache=None,  # args: maximum size in bytes of the persistent generation cache
+                 sharedentity=False,  # args: True to let instances with the same parameter values share an entity
+                 deterministic=False,  # args: True to leave out the date, and leave unchanged output alone
+                 argv=None,  # args: the command line to act upon, sys.argv[1:] if None
+                 script=None,  # args: the component's source file, the module creating the Qgen object if None
+                 directory=None,  # args: where the simulation, conversion and _hw.tcl go, the current directory if None
+                 autorun=True  # args: False to only describe the component, main() does the rest
                  ):
         self.modulename = modulename
         self.testbench = testbench
         self.convert = convert
         self.elaborate = elaborate
         self.gentcl = gentcl
+        self.elaboratecache = elaboratecache
+        self.perflog = perflog
+        self.generatecache = generatecache
+        self.sharedentity = sharedentity
+        self.deterministic = deterministic
+        self.genericlist = genericlist
+        self.connectionpointdecls = connectionpointlist
+        self.directory = directory
+        # the stages run in processes of their own start this file, whatever sys.argv[0] is (a worker, build)
+        script = script or sys._getframe(1).f_globals.get('__file__') or sys.argv[0]
+        if script.endswith(('.pyc', '.pyo')):
+            script = script[:-1]
+        self.script = os.path.abspath(script)
+        if autorun:
+            status = self.main(argv)
+            # after a Qsys Elaborate call nothing else in the script may write to stdout
+            if status or self.finished:
+                sys.exit(status)
+
+    def main(self, argv=None):
+        ''' does what the command line asks for: answer Qsys, or simulate, convert and generate the _hw.tcl
+            argv: the arguments, sys.argv[1:] if None
+            returns the exit status: 0, or 1 if something failed
+        '''
+        # the call is all there is to do in this process (a Qsys Elaborate call, --checkderived)
+        self.finished = False
+        modulename = self.modulename
+        genericlist = self.genericlist
+        connectionpointlist = self.connectionpointdecls
+        argv = sys.argv[1:] if argv is None else list(argv)
+        # the fast path: a plain Qsys Elaboration call skips argparse altogether
+        qsysargs = fastpath.qsyselaborateargs(argv)
+        if qsysargs is not None and self.elaborate is not None:
+            self.qsyselaborate(qsysargs)
+            self.finished = True
+            return 0
+
+        import argparse
         # parsing arguments with argparse takes some learning,
         # but is handy especially as the usage() and help is generated for you ...
         parser = argparse.ArgumentParser(description=modulename)
@@ -66,9 +141,25 @@ class Qgen(object):
                             help='Verbose - print out what happens along the way')
         parser.add_argument('-e', '--QsysElaborate', nargs='*')
         parser.add_argument('-g', '--QsysGenerate', nargs='*')
+        parser.add_argument('--sharedfiles', action='store_true',
+                            help='Generate into a directory of its own: the files all instances share go elsewhere')
+        parser.add_argument('-s', '--QsysSpeculate', nargs='*',
+                            help='Convert in the background for a Generate call to come')
         parser.add_argument('-l', '--targetHDL', type=str, default=None)
         parser.add_argument('-i', '--ignoreQsys', action='store_true')
-        self.args = parser.parse_args()
+        parser.add_argument('-c', '--checkderived', action='store_true',
+                            help='Check that Python and Tcl agree on the derived-parameter expressions')
+        parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help='Simulate, convert and generate the _hw.tcl in (at most) this many processes')
+        parser.add_argument('--watch', action='store_true',
+                            help='Stay resident, and rerun the stages affected by a change to the sources')
+        parser.add_argument('--stage', choices=('simulate', 'vhdl', 'verilog', 'hwtcl'),
+                            help=argparse.SUPPRESS)
+        parser.add_argument('--directory', help=argparse.SUPPRESS)
+        self.args = parser.parse_args(argv)
+        if self.args.directory is not None:
+            # a stage started by runparallel, the directory may have been set by whoever started its parent
+            self.directory = self.args.directory
 
         if self.args.verbose:
             print("Arguments: {}" .format(self.args))
@@ -78,63 +169,222 @@ class Qgen(object):
             if self.args.verbose:
                 print('QsysElaborate')
             if self.elaborate is not None:
-                # qsysarguments contains all the parameters with the currently assigned values (in the Qsys GUI)
-                # use a dictionary to pair the arguments
-                qsysargdict = {}
-                for name, value in zip(self.args.QsysElaborate[0::2], self.args.QsysElaborate[1::2]):
-                    qsysargdict[name] = value
-
-                print(self.elaborate(qsysargdict), file=sys.stdout)
-                sys.exit(0)
+                self.qsyselaborate(self.args.QsysElaborate)
+                self.finished = True
+                return 0
             else:
                 print("No Elaboration function given!")
-                return None
+                return 0
 
         if genericlist:
             self.generics = generics.Generics(genericlist)
+            if self.args.checkderived:
+                mismatches = expression.crosscheck(self.generics)
+                for key, values, pythonresult, tclresult in mismatches:
+                    print('{}: Python {} <> Tcl {} for {}'.format(key, pythonresult, tclresult, values))
+                print('Derived-parameter expressions: {} mismatch(es)'.format(len(mismatches)))
+                self.finished = True
+                return 1 if mismatches else 0
+
             # must update generics with values from Qsys before building connection points
+            self.log = None
+            # what Generate tells the _hw.tcl, besides the cache outcome
+            self.generated = {}
             if self.args.QsysGenerate and not self.args.ignoreQsys:
                 # Qsys calling on us to generate
-                if self.args.verbose:
-                    # redirect the console output to a log-file
-                    redirect = open('{}.log'.format(modulename), 'w')
-                    sys.stdout = redirect
-                    sys.stderr = redirect
-                    # tell us all about it
-                    print(sys.version)
-                    print("Qsys arguments: {}" .format(self.args.QsysGenerate))
-
-                # update the generics
-                for key, value in zip(self.args.QsysGenerate[2::2], self.args.QsysGenerate[3::2]):
+                # update the generics, the _hw.tcl sends them on stdin ('-'), older ones as pairs
+                self.qsysargdict, _ = fastpath.parameters(self.args.QsysGenerate[2:])
+                # with verbose, what is printed goes into the performance log
+                self.log = perflogging.PerfLog(self.perflogpath(self.args.verbose), modulename, 'generate',
+                                           self.qsysargdict, imports=importtime())
+            elif self.args.QsysSpeculate and not self.args.ignoreQsys:
+                self.qsysargdict, _ = fastpath.parameters(self.args.QsysSpeculate)
+                self.log = perflogging.PerfLog(self.perflogpath(self.args.verbose), modulename, 'speculate',
+                                           self.qsysargdict, imports=importtime())
+            else:
+                self.qsysargdict = None
+
+            if self.qsysargdict is not None:
+                for key, value in self.qsysargdict.items():
                     self.generics.genericlist['{}'.format(key)].update(value)
 
+            # the expression-derived generics follow the others
+            self.generics.evaluatederived()
+
             if connectionpointlist:
                 self.connectionpointlist = connectionpoints.ConnectionPoints(self.generics, connectionpointlist)
-                self.run()
+                if self.log is None:
+                    return self.run()
+                try:
+                    with self.log.capture(self.args.verbose):
+                        if self.args.verbose:
+                            # tell us all about it
+                            print(sys.version)
+                            print("Qsys arguments: {}" .format(self.args))
+                        status = self.run()
+                finally:
+                    self.log.write()
+                if self.args.QsysGenerate:
+                    # for the _hw.tcl timing report
+                    fastpath.respond((), metadata=dict(self.log.record['cache'], **self.generated))
+                return status
 
         else:
             self.generics = generics.Generics()
             self.connectionpointlist = connectionpoints.ConnectionPoints()
+        return 0
 
     def run(self):
+        ''' returns the exit status '''
+        import myhdl
+
         # can now either generate or simulate/convert/generateTcl
         if self.args.QsysGenerate and not self.args.ignoreQsys:
             if self.args.verbose:
                 print('Generating {} for Qsys' .format(self.args.targetHDL))
-            # force std_logic_vectors instead of unsigned in Interface as Qsys wants this
-            myhdl.toVHDL.std_logic_ports = True
-            self.convert(self, 'vhdl')  # override self.args.targetHDL as this is 'always'verilog?
-            # rename the entity and architecture identifiers to match the name given by Qsys
-            generate.updateEntity("{}" .format(self.modulename), self.args.QsysGenerate[1])
-            # delete existing target
-            target = "{}{}.vhd" .format(self.args.QsysGenerate[0], self.args.QsysGenerate[1])
-            if os.path.exists(target):
-                os.remove(target)
-            os.rename("{}.vhd".format(self.modulename), target)
+            outdir, outputname = self.args.QsysGenerate[0], self.args.QsysGenerate[1]
+            # the file set callbacks give every call a temporary directory of its own
+            shareddir = cache.shareddirectory() if self.args.sharedfiles else outdir
+            # Qsys passes its HDL_LANGUAGE, VHDL or VERILOG
+            hdl = 'verilog' if (self.args.targetHDL or '').lower() == 'verilog' else 'vhdl'
+            extension = 'vhd' if hdl == 'vhdl' else 'v'
+            # the generation cache, the speculative conversion and the shared entity all go by it
+            key = self.generationkey(hdl)
+            if self.sharedentity:
+                # named after the parameter values: identical instances share it, behind a wrapper of their own
+                entityname = '{}_{}'.format(self.modulename, key[:8])
+            else:
+                entityname = outputname
+            entity = os.path.join(shareddir if self.sharedentity else outdir, '{}.{}'.format(entityname, extension))
+
+            def rename(source, destination):
+                # converted elsewhere: the entity still has the module's name
+                generate.renameEntity(source, destination, self.modulename, entityname)
+
+            def unrename(source, destination):
+                generate.renameEntity(source, destination, entityname, self.modulename)
+
+            # every invocation works in a directory of its own, next to the entity (so a rename can publish)
+            scratch = tempfile.mkdtemp(prefix='.{}.'.format(outputname), dir=os.path.dirname(entity))
+            converted = os.path.join(scratch, os.path.basename(entity))
+            try:
+                # one MyHDL package for all instances, unless this MyHDL only writes it along with
+                # a conversion and none did so yet: then this call converts, whatever the caches hold
+                package = generate.writeMyHDLPackage(shareddir) if hdl == 'vhdl' else None
+                needpackage = hdl == 'vhdl' and package is None
+                if self.sharedentity and os.path.exists(entity) and not needpackage:
+                    # another instance generated it already, cache.pruneshared() goes by when it was last used
+                    os.utime(entity, None)
+                    self.log.record['cache']['entity'] = 'shared'
+                else:
+                    generation = None
+                    if self.generatecache and not needpackage:
+                        # the entity keeps the module's name in the cache, so any instance can use it
+                        generation = cache.GenerationCache(maxbytes=self.generatecache)
+                        with self.log.phase('cache'):
+                            cached = generation.fetch(key, converted, rename)
+                        self.log.record['cache']['generate'] = 'hit' if cached else 'miss'
+                    if generation is None or not cached:
+                        speculated = False
+                        if hdl == 'vhdl' and not needpackage:
+                            # the Elaborate callback may have started the (VHDL) conversion already
+                            speculation = speculate.Speculation(key)
+                            with self.log.phase('speculation'):
+                                speculated = speculation.wait()
+                                if speculated:
+                                    speculation.fetch(converted, rename)
+                                    self.log.record['cache']['speculation'] = 'hit'
+                        if not speculated:
+                            with self.log.phase('convert'):
+                                # let MyHDL name the entity as we want it
+                                self.convertqsys(scratch, hdl, entityname)
+                            if needpackage:
+                                package = generate.writeMyHDLPackage(shareddir, scratch)
+                        if generation is not None:
+                            with self.log.phase('cache'):
+                                generation.put(key, converted, unrename)
+                    with self.log.phase('publish'):
+                        generate.publish(converted, entity, self.deterministic)
+                # the files the _hw.tcl adds ahead of OUTPUT_NAME.vhd (or .v)
+                files = []
+                if package is not None:
+                    files.append(self.sharedfile(shareddir, package))
+                if self.sharedentity:
+                    files.append(self.sharedfile(shareddir, os.path.basename(entity)))
+                    wrapper = os.path.join(outdir, '{}.{}'.format(outputname, extension))
+                    # writeWrapper goes by the extension
+                    temporary = os.path.join(outdir, '.{}.{}'.format(os.getpid(), os.path.basename(wrapper)))
+                    with self.log.phase('publish'):
+                        generate.writeWrapper(entity, temporary, entityname, outputname)
+                        generate.publish(temporary, wrapper, self.deterministic)
+                # a Tcl list
+                self.generated['files'] = ' '.join('{{{}}}'.format(name) if ' ' in name else name for name in files)
+            finally:
+                shutil.rmtree(scratch, ignore_errors=True)
+        elif self.args.QsysSpeculate and not self.args.ignoreQsys:
+            speculation = speculate.Speculation(self.generationkey('vhdl'))
+            if speculation.ready() or not speculation.acquire():
+                # done, or being done
+                return 0
+            scratch = tempfile.mkdtemp(dir=speculation.directory)
+            try:
+                with self.log.phase('convert'):
+                    self.convertqsys(scratch)
+                speculation.publish(os.path.join(scratch, '{}.vhd'.format(self.modulename)))
+            finally:
+                shutil.rmtree(scratch, ignore_errors=True)
+                speculation.release()
+            # the results nobody came for
+            speculate.prune(speculate.MAXAGE)
         else:
             if self.args.verbose:
                 print('Simulate, Convert, Generate _hw.tcl')
-            if self.testbench:
+            if self.args.stage:
+                # one of the stages started by runparallel
+                self.runstage(self.args.stage)
+            elif self.args.jobs > 1:
+                if self.runparallel(self.args.jobs) and not self.args.watch:
+                    return 1
+            else:
+                for stage in self.stages():
+                    self.runstage(stage)
+            if self.args.watch:
+                self.watch()
+        return 0
+
+    def stages(self):
+        ''' what the normal (not Qsys) mode does, in this order '''
+        stages = []
+        if self.testbench:
+            stages.append('simulate')
+        if self.convert:
+            if self.args.targetHDL is not None:
+                stages.append(self.args.targetHDL.lower())
+            else:
+                # do both languages
+                stages.extend(['vhdl', 'verilog'])
+        if self.gentcl:
+            stages.append('hwtcl')
+        return stages
+
+    def outputs(self):
+        ''' the files the stages other than hwtcl write: the VCD file and the converted HDL
+            (named after the component, as convert is expected to do)
+        '''
+        result = []
+        for stage in self.stages():
+            if stage == 'simulate':
+                result.append('{}.vcd'.format(self.testbench[1].__name__))
+            elif stage in ('vhdl', 'verilog'):
+                result.append('{}.{}'.format(self.modulename, 'vhd' if stage == 'vhdl' else 'v'))
+        return [os.path.join(self.directory or '', filename) for filename in result]
+
+    def runstage(self, stage):
+        ''' MyHDL simulates and converts with process-wide state, one thread at a time '''
+        import myhdl
+
+        if stage == 'simulate':
+            with myhdllock:
                 # remove 'old' .vcd file
                 filename = self.testbench[1].__name__ + ".vcd"
                 if os.access(filename, os.F_OK):
@@ -145,23 +395,188 @@ class Qgen(object):
 
                 sim = myhdl.Simulation(testbench)
                 sim.run(self.testbench[0])
-
-            if self.convert:
-                if self.args.targetHDL is not None:
-                    self.convert(self, self.args.targetHDL)
-                else:
-                    # do both languages
-                    self.convert(self, 'vhdl')
-                    self.convert(self, 'verilog')
-
-            if self.gentcl:
-                generate.writeHwTcl(self.generics, self.connectionpointlist, self.modulename,
-                                    version=self.gentcl[0],
-                                    author=self.gentcl[1],
-                                    group=self.gentcl[2])
+                # traceSignals only writes into the current directory
+                if self.directory is not None:
+                    generate.publish(filename, os.path.join(self.directory, filename))
+        elif stage == 'hwtcl':
+            self.GenTcl(self.gentcl)
+        else:
+            converter = myhdl.toVHDL if stage == 'vhdl' else myhdl.toVerilog
+            with myhdllock:
+                directory = converter.directory
+                converter.directory = self.directory
+                try:
+                    self.convert(self, stage)
+                finally:
+                    converter.directory = directory
+
+    def runparallel(self, jobs, stages=None):
+        ''' runs every stage (or those given) in a process of its own (this script with --stage), jobs at a time
+            reports them in order, with the output of those that failed, returns how many failed
+        '''
+        import subprocess
+        from multiprocessing.pool import ThreadPool
+
+        def run(stage):
+            command = [sys.executable, self.script, '--stage', stage]
+            if self.directory is not None:
+                command.extend(['--directory', os.path.abspath(self.directory)])
+            if self.args.verbose:
+                command.append('-v')
+            start = time.time()
+            process = subprocess.Popen(command, universal_newlines=True,
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            output = process.communicate()[0]
+            return stage, process.returncode, output, time.time() - start
+
+        pool = ThreadPool(jobs)
+        try:
+            results = pool.map(run, self.stages() if stages is None else stages)
+        finally:
+            pool.close()
+
+        failed = 0
+        for stage, returncode, output, duration in results:
+            if returncode:
+                failed += 1
+                print('{}: failed ({}) after {:.1f} s'.format(stage, returncode, duration))
+            else:
+                print('{}: done in {:.1f} s'.format(stage, duration))
+            if returncode or self.args.verbose:
+                for line in output.splitlines():
+                    print('    {}'.format(line))
+        return failed
+
+    def watch(self):
+        ''' reruns the stages a change to the component, its helper modules or Qgen affects,
+            each in a fresh process (this script with --stage) so it sees the new code
+        '''
+        import Utilities.Qgen.watch as watching
+        script = self.script
+        sources = set(cache.componentsources(script))
+        # the elaborate module, given as 'module:function', and whatever it imports in turn
+        elaboratefile, elaboratesources = None, set()
+        if isinstance(self.elaborate, str):
+            elaboratefile = cache.findmodule(self.elaborate.partition(':')[0], [os.path.dirname(script)] + sys.path)
+            if elaboratefile is not None:
+                elaboratefile = os.path.abspath(elaboratefile)
+                elaboratesources = set(cache.componentsources(elaboratefile)) - sources
+                elaboratesources.add(elaboratefile)
+        qgensources = set(cache.qgensources())
+        watcher = watching.Watcher(script, sorted(sources | elaboratesources))
+        names = dict(elaborate=None if isinstance(self.elaborate, str) else getattr(self.elaborate, '__name__', None),
+                     testbench=self.testbench[1].__name__ if self.testbench else None,
+                     convert=getattr(self.convert, '__name__', None))
+        print('Watching {} file(s), Ctrl-C to stop'.format(len(watcher.mtimes)))
+        try:
+            while True:
+                stages, elaborate = set(), False
+                for filename in watcher.wait():
+                    if filename == script:
+                        try:
+                            functions = watching.functions(script)
+                        except SyntaxError as exc:
+                            print('{}: {}'.format(filename, exc))
+                            continue
+                        changed, changedelaborate = watching.affected(watcher.functions, functions, **names)
+                        watcher.functions = functions
+                    elif filename in qgensources:
+                        # Qgen itself
+                        changed, changedelaborate = set(watching.STAGES), False
+                    elif filename == elaboratefile or filename in elaboratesources:
+                        # the elaborate module or a helper only it uses
+                        changed, changedelaborate = set(['hwtcl']), True
+                    else:
+                        # a helper module the component imports, most likely part of the DUT
+                        changed, changedelaborate = set(['simulate', 'vhdl', 'verilog']), False
+                    stages |= changed
+                    elaborate = elaborate or changedelaborate
+                stages = [stage for stage in self.stages() if stage in stages]
+                if elaborate and self.elaboratecache:
+                    cache.ElaborateCache(maxentries=self.elaboratecache).clear()
+                    print('Cleared the elaborate cache')
+                if stages:
+                    print('{}: {}'.format(time.strftime('%H:%M:%S'), ', '.join(stages)))
+                    self.runparallel(max(self.args.jobs, 1), stages)
+        except KeyboardInterrupt:
+            print()
+
+    def perflogpath(self, verbose=False):
+        ''' where the performance log goes, None if nowhere '''
+        if isinstance(self.perflog, str):
+            return self.perflog
+        if self.perflog or verbose:
+            return '{}.perf.jsonl'.format(self.modulename)
+        return None
+
+    def sharedfile(self, shareddir, filename):
+        ''' how the _hw.tcl finds filename in shareddir: relative to the output directory, or the full path
+            (with forward slashes, as Tcl wants it)
+        '''
+        if not self.args.sharedfiles:
+            return filename
+        return os.path.abspath(os.path.join(shareddir, filename)).replace(os.sep, '/')
+
+    def generationkey(self, hdl):
+        ''' identifies converting the component, with the current generic values, into hdl '''
+        import myhdl
+        values = dict((name, self.generics.value(name)) for name in self.generics.parameters())
+        return cache.generationkey(cache.componentsources(self.script), values, myhdl.__version__, hdl)
+
+    def convertqsys(self, directory, hdl='vhdl', name=None):
+        ''' converts for Qsys, into directory, optionally renaming the entity (or module)
+            MyHDL's conversion settings are global, so only one thread at a time
+        '''
+        import myhdl
+        converter = myhdl.toVHDL if hdl == 'vhdl' else myhdl.toVerilog
+        with myhdllock:
+            stdlogicports = myhdl.toVHDL.std_logic_ports
+            notestbench = myhdl.toVerilog.no_testbench
+            nopackage = myhdl.toVHDL.no_myhdl_package
+            header, nomyhdlheader = converter.header, converter.no_myhdl_header
+            # force std_logic_vectors instead of unsigned in Interface as Qsys wants this
+            myhdl.toVHDL.std_logic_ports = True
+            # and Qsys has no use for a Verilog testbench
+            myhdl.toVerilog.no_testbench = True
+            # the MyHDL package is shared, see generate.writeMyHDLPackage
+            # unless this MyHDL doesn't let us write it ourselves: then the converter has to
+            myhdl.toVHDL.no_myhdl_package = generate.myhdlpackage() is not None
+            # MyHDL's own header names the (scratch) directory we convert into, and the date
+            comment = '--' if hdl == 'vhdl' else '//'
+            converter.no_myhdl_header = True
+            converter.header = '{0} File: {1}.{2}\n{0} Generated by MyHDL $version'.format(
+                comment, name or self.modulename, 'vhd' if hdl == 'vhdl' else 'v')
+            if not self.deterministic:
+                converter.header += '\n{} Date: $date'.format(comment)
+            converter.name = name
+            converter.directory = directory
+            try:
+                self.convert(self, hdl)
+            finally:
+                myhdl.toVHDL.std_logic_ports = stdlogicports
+                myhdl.toVerilog.no_testbench = notestbench
+                myhdl.toVHDL.no_myhdl_package = nopackage
+                converter.header, converter.no_myhdl_header = header, nomyhdlheader
+                converter.name = None
+                converter.directory = None
+
+    def qsyselaborate(self, qsysargs):
+        ''' answer the Qsys Elaboration call '''
+        if not self.perflog:
+            fastpath.elaborate(self.elaborate, qsysargs, cache=self.elaboratecache)
+            return
+        log = perflogging.PerfLog(self.perflogpath(), self.modulename, 'elaborate',
+                                  imports=importtime(withmyhdl=False))
+        with log.phase('elaborate'):
+            log.record['parameters'], metadata = fastpath.elaborate(self.elaborate, qsysargs,
+                                                                    cache=self.elaboratecache)
+        if 'cache' in metadata:
+            log.record['cache']['elaborate'] = metadata['cache']
+        log.write()
 
     def addgenericlist(self, genericlist):
         self.generics = generics.Generics(genericlist)
+        self.generics.evaluatederived()
 
     def addsection(self, section):
         self.generics.addsection(section)
@@ -222,8 +637,17 @@ class Qgen(object):
 #         return self.connectionpointlist.interfacesignals(interface)
 
     def GenTcl(self, gentcl):
+        ''' gentcl: (version, author, group [, {writeHwTcl options}]) '''
+        options = dict(gentcl[3]) if len(gentcl) > 3 else {}
+        # if given as 'module:function' the elaborate function lives in a module of its own
+        # and the _hw.tcl uses the fast path
+        options.setdefault('elaborate', self.elaborate)
+        options.setdefault('elaboratecache', self.elaboratecache)
+        options.setdefault('directory', self.directory)
+        if options.get('depfile'):
+            options.setdefault('depoutputs', self.outputs())
         generate.writeHwTcl(self.generics, self.connectionpointlist, self.modulename,
-                            version=gentcl[0], author=gentcl[1], group=gentcl[2])
+                            version=gentcl[0], author=gentcl[1], group=gentcl[2], **options)
 
     def show(self):
         self.generics.show()
@@ -4,4 +4,4 @@ Created on 22 Jul 2015
 @author: Josy
 '''
 
-__all__ = ['Qgen', 'generics', 'generate', 'qerror', 'connectionpoints']
+__all__ = ['Qgen', 'generics', 'generate', 'qerror', 'connectionpoints', 'server', 'fastpath', 'expression', 'cache', 'prewarm', 'speculate', 'perflog', 'build', 'stresstest', 'watch', 'template', 'hwtclbench']
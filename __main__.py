@@ -0,0 +1,92 @@
+#  This file is part of the Qgen utility, a Python package for
+#  extending the MyHDL package
+#
+#  Copyright (C) 2014-2015 Josy Boelen
+#
+#  The Qgen utility is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public License as
+#  published by the Free Software Foundation; either version 3.0 of the
+#  License, or (at your option) any later version.
+#
+#  This utility is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+'''
+the qgen command line
+
+    python -m Utilities.Qgen prewarm system.qsys [--generate]
+    python -m Utilities.Qgen cache stats|prune
+    python -m Utilities.Qgen build directory|component.py ...
+'''
+
+from __future__ import print_function
+
+import sys
+import argparse
+
+import Utilities.Qgen.qerror as qerror
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='qgen')
+    commands = parser.add_subparsers(dest='command')
+
+    prewarm = commands.add_parser('prewarm', help='elaborate (and generate) every Qgen instance of a Qsys system ahead of Qsys')
+    prewarm.add_argument('qsysfile')
+    prewarm.add_argument('-s', '--search', action='append',
+                         help='where to look for the xxx_hw.tcl files, default the directory of the .qsys file')
+    prewarm.add_argument('-j', '--jobs', type=int, default=None,
+                         help='the number of instances to elaborate at once, default the number of cores')
+    prewarm.add_argument('-g', '--generate', action='store_true',
+                         help='generate every instance as well, to fill the generation cache')
+    prewarm.add_argument('-l', '--language', choices=('VHDL', 'VERILOG'), default='VHDL',
+                         help='the HDL to generate')
+    prewarm.add_argument('-v', '--verbose', action='store_true')
+
+    cache = commands.add_parser('cache', help='the persistent elaborate and generation caches')
+    cache.add_argument('action', choices=('stats', 'prune'))
+    cache.add_argument('--maxentries', type=int, default=4096,
+                       help='prune the elaborate cache down to this many entries')
+    cache.add_argument('--maxbytes', type=int, default=256 * 1024 * 1024,
+                       help='prune the generation cache down to this many bytes')
+
+    build = commands.add_parser('build', help='simulate, convert and write the xxx_hw.tcl of many components')
+    build.add_argument('paths', nargs='+', help='component scripts, or directories to look for them')
+    build.add_argument('-j', '--jobs', type=int, default=None,
+                       help='the number of worker processes, default the number of cores')
+    build.add_argument('-v', '--verbose', action='store_true')
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == 'prewarm':
+            import Utilities.Qgen.prewarm as prewarming
+            results = prewarming.prewarm(args.qsysfile, args.search, args.jobs, args.verbose,
+                                         args.generate, args.language)
+            return 1 if any(isinstance(result[1], Exception) for result in results) else 0
+        elif args.command == 'cache':
+            import Utilities.Qgen.cache as caches
+            if args.action == 'prune':
+                import Utilities.Qgen.speculate as speculate
+                caches.ElaborateCache().prune(args.maxentries)
+                caches.GenerationCache().prune(args.maxbytes)
+                print('Removed {} finished speculative conversion(s)'.format(speculate.prune()))
+                print('Removed {} shared file(s) not used for a day'.format(caches.pruneshared()))
+            caches.report()
+        elif args.command == 'build':
+            import Utilities.Qgen.build as building
+            results = building.build(args.paths, args.jobs, args.verbose)
+            return 1 if any(result[1] != 'ok' for result in results) else 0
+    except qerror.QError as exc:
+        print("Something went wrong! -> {}" .format(exc))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
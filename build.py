@@ -0,0 +1,96 @@
+#  This file is part of the Qgen utility, a Python package for
+#  extending the MyHDL package
+#
+#  Copyright (C) 2014-2015 Josy Boelen
+#
+#  The Qgen utility is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public License as
+#  published by the Free Software Foundation; either version 3.0 of the
+#  License, or (at your option) any later version.
+#
+#  This utility is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+'''
+build many components at once: simulate, convert and write the xxx_hw.tcl of each
+
+    python -m Utilities.Qgen build directory|component.py ... [-j jobs]
+
+every component runs as if started by 'python component.py', in its own directory,
+but in a pool of long-lived worker processes: MyHDL is imported once per worker
+instead of once per component
+'''
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import multiprocessing
+
+import Utilities.Qgen.server as server
+
+
+def components(paths):
+    ''' the component scripts: the .py files given, and those in the directories (and below) that call Qgen '''
+    result = []
+    for path in paths:
+        if not os.path.isdir(path):
+            result.append(os.path.abspath(path))
+            continue
+        for root, _, files in os.walk(path):
+            for filename in sorted(files):
+                if not filename.endswith('.py'):
+                    continue
+                with open(os.path.join(root, filename), 'r') as source:
+                    if 'Qgen(' in source.read():
+                        result.append(os.path.abspath(os.path.join(root, filename)))
+    return result
+
+
+def buildone(script):
+    ''' runs in a worker: returns the script, 'ok' or 'error', what it printed and the time it took '''
+    start = time.time()
+    status, out, err = server.Worker(None, None).execute(os.path.dirname(script), script, [])
+    return script, status, out + err, time.time() - start
+
+
+def build(paths, jobs=None, verbose=False):
+    ''' builds every component, jobs at a time, returns a list of (script, status, output, duration) '''
+    scripts = components(paths)
+    # the workers change directory, where Python finds its modules may not depend on it
+    # (python -m leaves '' in sys.path, and the packages it imported relative to it)
+    sys.path[:] = [os.path.abspath(path) for path in sys.path]
+    for module in list(sys.modules.values()):
+        if isinstance(getattr(module, '__path__', None), list):
+            module.__path__[:] = [os.path.abspath(path) for path in module.__path__]
+    # imported here, before the workers start, so where they are forked they share them
+    import myhdl
+    import Utilities.Qgen.Qgen
+    start = time.time()
+    pool = multiprocessing.Pool(jobs or None)
+    try:
+        results = pool.map(buildone, scripts, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    for script, status, output, duration in results:
+        print('{}: {} in {:.1f} s'.format(script, 'done' if status == 'ok' else 'failed', duration))
+        if status != 'ok' or verbose:
+            for line in output.splitlines():
+                print('    {}'.format(line))
+    print('Built {} component(s) in {:.1f} s ({:.1f} s one after the other)'
+          .format(len(results), time.time() - start, sum(result[3] for result in results)))
+    return results
+
+
+if __name__ == '__main__':
+    # ''' here we add some tests '''
+    print(components(sys.argv[1:] or ['.']))
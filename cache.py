@@ -0,0 +1,391 @@
+#  This file is part of the Qgen utility, a Python package for
+#  extending the MyHDL package
+#
+#  Copyright (C) 2014-2015 Josy Boelen
+#
+#  The Qgen utility is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public License as
+#  published by the Free Software Foundation; either version 3.0 of the
+#  License, or (at your option) any later version.
+#
+#  This utility is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+'''
+persistent caches, shared by every Qsys session (and every process) on this machine
+
+the location defaults to ~/.qgen, set QGEN_CACHE to move it
+
+    python -m Utilities.Qgen cache stats    reports the hit and miss counts
+    python -m Utilities.Qgen cache prune    evicts down to the size bounds
+'''
+
+from __future__ import print_function
+
+import os
+import sys
+import ast
+import time
+import site
+import shutil
+import hashlib
+import sqlite3
+import sysconfig
+
+
+def directory():
+    return os.environ.get('QGEN_CACHE', os.path.join(os.path.expanduser('~'), '.qgen'))
+
+
+def filehash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as source:
+        digest.update(source.read())
+    return digest.hexdigest()
+
+
+def sourcehash(function):
+    ''' a hash of the source file the function lives in '''
+    code = getattr(function, '__code__', None) or getattr(function, 'func_code')
+    digest = hashlib.sha1(filehash(code.co_filename).encode('utf-8'))
+    digest.update(function.__name__.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def connect(location, filename):
+    ''' an sqlite database in the cache directory, with a table for the hit and miss counts '''
+    if not os.path.isdir(location):
+        try:
+            os.makedirs(location)
+        except OSError:
+            # another process beat us to it
+            pass
+    connection = sqlite3.connect(os.path.join(location, filename), timeout=30, isolation_level=None)
+    # losing the cache in a crash is harmless, waiting for the disk is not
+    connection.execute('PRAGMA synchronous=OFF')
+    connection.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, count INTEGER)')
+    return connection
+
+
+def count(connection, name, increment=1):
+    connection.execute('INSERT OR IGNORE INTO stats VALUES (?, 0)', (name,))
+    connection.execute('UPDATE stats SET count = count + ? WHERE name = ?', (increment, name))
+
+
+class ElaborateCache(object):
+    ''' the results of the elaborate function, keyed on the parameter values
+        and a hash of the component source, so a stale entry is never served
+        sqlite takes care of concurrent Qsys processes
+        the least recently used entries are evicted above maxentries
+    '''
+
+    def __init__(self, location=None, maxentries=4096):
+        self.maxentries = maxentries
+        self.connection = connect(location or directory(), 'elaborate.sqlite')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS elaborate '
+                                '(key TEXT PRIMARY KEY, result TEXT, lastused REAL)')
+
+    def key(self, function, qsysargdict):
+        digest = hashlib.sha1(sourcehash(function).encode('utf-8'))
+        for name in sorted(qsysargdict):
+            digest.update('{}={}\n'.format(name, qsysargdict[name]).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        ''' returns the cached result, or None '''
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.connection.execute('SELECT result FROM elaborate WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                self.connection.execute('UPDATE elaborate SET lastused = ? WHERE key = ?', (time.time(), key))
+            count(self.connection, 'hits' if row is not None else 'misses')
+        finally:
+            self.connection.execute('COMMIT')
+        return row[0] if row is not None else None
+
+    def put(self, key, result):
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            self.connection.execute('INSERT OR REPLACE INTO elaborate VALUES (?, ?, ?)', (key, result, time.time()))
+            self.evict(self.maxentries)
+        finally:
+            self.connection.execute('COMMIT')
+
+    def prune(self, maxentries=None):
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            self.evict(self.maxentries if maxentries is None else maxentries)
+        finally:
+            self.connection.execute('COMMIT')
+
+    def evict(self, maxentries):
+        ''' evict the least recently used entries above maxentries '''
+        excess = self.connection.execute('SELECT COUNT(*) FROM elaborate').fetchone()[0] - maxentries
+        if excess > 0:
+            self.connection.execute('DELETE FROM elaborate WHERE key IN '
+                                    '(SELECT key FROM elaborate ORDER BY lastused LIMIT ?)', (excess,))
+            count(self.connection, 'evictions', excess)
+
+    def clear(self):
+        self.connection.execute('DELETE FROM elaborate')
+
+    def stats(self):
+        ''' returns a dictionary with the hit, miss and eviction counts and the number of entries '''
+        result = {'hits': 0, 'misses': 0, 'evictions': 0}
+        result.update(dict(self.connection.execute('SELECT name, count FROM stats').fetchall()))
+        result['entries'] = self.connection.execute('SELECT COUNT(*) FROM elaborate').fetchone()[0]
+        return result
+
+
+def generationkey(sources, values, version, hdl):
+    ''' what identifies a conversion: the component's source files, the parameter values,
+        the MyHDL version and the target HDL
+    '''
+    digest = hashlib.sha1()
+    for source in sorted(sources):
+        digest.update(filehash(source).encode('utf-8'))
+    for name in sorted(values):
+        digest.update('{}={}\n'.format(name, values[name]).encode('utf-8'))
+    digest.update('{} {}'.format(version, hdl).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class GenerationCache(object):
+    ''' the converted HDL files, keyed on a hash of the component and the modules it loaded
+        (see componentsources()), the generic values, the MyHDL version and the HDL
+        the files live in the cache directory, an sqlite index keeps track of their size and use
+        the least recently used ones are evicted above maxbytes
+    '''
+
+    def __init__(self, location=None, maxbytes=256 * 1024 * 1024):
+        location = location or directory()
+        self.maxbytes = maxbytes
+        self.connection = connect(location, 'generate.sqlite')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS generate '
+                                '(key TEXT PRIMARY KEY, size INTEGER, lastused REAL)')
+        self.files = os.path.join(location, 'generate')
+        if not os.path.isdir(self.files):
+            try:
+                os.makedirs(self.files)
+            except OSError:
+                pass
+
+    def key(self, sources, values, version, hdl):
+        return generationkey(sources, values, version, hdl)
+
+    def path(self, key):
+        return os.path.join(self.files, key)
+
+    def fetch(self, key, filename, copy=shutil.copyfile):
+        ''' copies the cached file to filename, returns False if there is none
+            copy(source, destination) may change the file on the way
+        '''
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.connection.execute('SELECT key FROM generate WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                try:
+                    copy(self.path(key), filename)
+                    self.connection.execute('UPDATE generate SET lastused = ? WHERE key = ?', (time.time(), key))
+                except (IOError, OSError):
+                    # the file went missing
+                    self.connection.execute('DELETE FROM generate WHERE key = ?', (key,))
+                    row = None
+            count(self.connection, 'hits' if row is not None else 'misses')
+        finally:
+            self.connection.execute('COMMIT')
+        return row is not None
+
+    def put(self, key, filename, copy=shutil.copyfile):
+        # copy next to its final place first, so a reader never sees half a file
+        temporary = '{}.{}.tmp'.format(self.path(key), os.getpid())
+        copy(filename, temporary)
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            if os.path.exists(self.path(key)):
+                # Windows doesn't rename over an existing file
+                os.remove(self.path(key))
+            os.rename(temporary, self.path(key))
+            self.connection.execute('INSERT OR REPLACE INTO generate VALUES (?, ?, ?)',
+                                    (key, os.path.getsize(self.path(key)), time.time()))
+            self.evict(self.maxbytes)
+        finally:
+            self.connection.execute('COMMIT')
+
+    def prune(self, maxbytes=None):
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            self.evict(self.maxbytes if maxbytes is None else maxbytes)
+        finally:
+            self.connection.execute('COMMIT')
+
+    def evict(self, maxbytes):
+        ''' evict the least recently used files above maxbytes '''
+        total = self.connection.execute('SELECT TOTAL(size) FROM generate').fetchone()[0]
+        evictions = 0
+        for key, size in self.connection.execute('SELECT key, size FROM generate ORDER BY lastused').fetchall():
+            if total <= maxbytes:
+                break
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+            self.connection.execute('DELETE FROM generate WHERE key = ?', (key,))
+            total -= size
+            evictions += 1
+        if evictions:
+            count(self.connection, 'evictions', evictions)
+
+    def stats(self):
+        ''' returns a dictionary with the hit, miss and eviction counts, the number of entries and their size '''
+        result = {'hits': 0, 'misses': 0, 'evictions': 0}
+        result.update(dict(self.connection.execute('SELECT name, count FROM stats').fetchall()))
+        result['entries'], result['bytes'] = self.connection.execute('SELECT COUNT(*), TOTAL(size) FROM generate').fetchone()
+        return result
+
+
+def shareddirectory():
+    ''' where Generate puts the files every instance shares when the output directory is one of its own
+        (the file set callbacks): the MyHDL package and the shared entities
+    '''
+    location = os.path.join(directory(), 'shared')
+    if not os.path.isdir(location):
+        try:
+            os.makedirs(location)
+        except OSError:
+            # another process beat us to it
+            pass
+    return location
+
+
+def pruneshared(maxage=24 * 3600):
+    ''' remove the shared files not used for maxage seconds, returns how many '''
+    location = os.path.join(directory(), 'shared')
+    removed = 0
+    if not os.path.isdir(location):
+        return removed
+    for name in os.listdir(location):
+        path = os.path.join(location, name)
+        try:
+            if os.path.isfile(path) and os.path.getmtime(path) + maxage < time.time():
+                os.remove(path)
+                removed += 1
+        except OSError:
+            # used again, or removed, meanwhile
+            pass
+    return removed
+
+
+def installation():
+    ''' the directories of the Python installation: the standard library and site-packages '''
+    paths = set(sysconfig.get_path(name) for name in ('stdlib', 'platstdlib', 'purelib', 'platlib'))
+    # a virtualenv may not have these
+    if hasattr(site, 'getsitepackages'):
+        paths.update(site.getsitepackages())
+    if hasattr(site, 'getusersitepackages'):
+        paths.add(site.getusersitepackages())
+    return [os.path.abspath(path) + os.sep for path in paths if path]
+
+
+# the Qgen modules the converted HDL depends on: the generics, the ports, the conversion and renaming
+QGENMODULES = ('Qgen', 'generics', 'expression', 'connectionpoints', 'generate')
+
+
+def findmodule(name, path):
+    ''' the source file of module name in the directories path, None if it isn't there (or is built in) '''
+    parts = name.split('.')
+    for location in path:
+        base = os.path.join(os.path.abspath(location or os.curdir), *parts)
+        for candidate in (base + '.py', os.path.join(base, '__init__.py')):
+            if os.path.isfile(candidate):
+                return candidate
+    return None
+
+
+def imports(filename):
+    ''' the modules filename imports, as (name, level) pairs, with the packages they live in
+        'from a import b' also gives a.b, in case b is a module
+    '''
+    with open(filename, 'r') as source:
+        tree = ast.parse(source.read(), filename)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update((alias.name, 0) for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            module = node.module or ''
+            if module:
+                names.add((module, node.level))
+            names.update(('.'.join(filter(None, [module, alias.name])), node.level) for alias in node.names
+                         if alias.name != '*')
+    for name, level in list(names):
+        parts = name.split('.')
+        names.update(('.'.join(parts[:i]), level) for i in range(1, len(parts)))
+    return sorted(names)
+
+
+def qgenmodule(name):
+    ''' Qgen itself goes by QGENMODULES, MyHDL by its version '''
+    return name in ('Utilities', 'Utilities.Qgen') or name.startswith('Utilities.Qgen.') \
+        or name.split('.')[0] == 'myhdl'
+
+
+def componentsources(script):
+    ''' the component, the modules it imports from outside the Python installation, followed through
+        their imports in turn (its own helper modules, wherever they are), and the Qgen modules in QGENMODULES
+        found by reading the sources, so it doesn't matter what the process loaded before
+    '''
+    prefixes = tuple(installation())
+    sources = set()
+    pending = [os.path.abspath(script)]
+    while pending:
+        filename = pending.pop()
+        if filename in sources:
+            continue
+        sources.add(filename)
+        try:
+            names = imports(filename)
+        except (IOError, SyntaxError):
+            continue
+        directory = os.path.dirname(filename)
+        for name, level in names:
+            if level == 0 and qgenmodule(name):
+                continue
+            if level:
+                # relative to the package filename is in
+                path = [os.path.normpath(os.path.join(directory, *[os.pardir] * (level - 1)))]
+            else:
+                # Python 2 looks next to the importing module first
+                path = [directory] + sys.path
+            found = findmodule(name, path)
+            if found is None:
+                continue
+            parts = found.split(os.sep)
+            if found.startswith(prefixes) or 'site-packages' in parts or 'dist-packages' in parts:
+                continue
+            pending.append(found)
+    return sorted(sources.union(qgensources()))
+
+
+def qgensources():
+    ''' the Qgen modules in QGENMODULES: the same ones whatever the process loaded '''
+    directory = os.path.dirname(os.path.abspath(__file__))
+    return [os.path.join(directory, '{}.py'.format(name)) for name in QGENMODULES]
+
+
+def report():
+    print('Elaborate cache {}: {entries} entries, {hits} hits, {misses} misses, {evictions} evictions'
+          .format(directory(), **ElaborateCache().stats()))
+    print('Generation cache {}: {entries} entries, {bytes:.0f} bytes, {hits} hits, {misses} misses, {evictions} evictions'
+          .format(os.path.join(directory(), 'generate'), **GenerationCache().stats()))
+
+
+if __name__ == '__main__':
+    report()
+    sys.exit(0)
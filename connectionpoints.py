@@ -31,22 +31,41 @@ from __future__ import print_function
 
 
 import sys
-import string
 import collections
 
-import myhdl
-
-import Utilities.hdlutils as hdlutils
+# myhdl and Utilities.hdlutils are imported where needed, keeping 'import Qgen' light
 
 import Utilities.Qgen.qerror as qerror
+import Utilities.Qgen.template as template
 
 # from Source.interfaces import AvalonInterface
 
-indent = 0
-
 BIG_ENDIAN = 1
 LITTLE_ENDIAN = 2
 
+CLOCK = template.Template(['# +-----------------------------------\n',
+                           '# | connection point _clk_\n',
+                           '# |\n',
+                           'add_interface _clk_ clock end\n',
+                           'set_interface_property _clk_ clockRate _clockrate_\n',
+                           'set_interface_property _clk_ ENABLED true\n',
+                           'add_interface_port _clk_ _clk_ clk Input 1\n',
+                           '# |\n',
+                           '# +-----------------------------------\n\n'],
+                          'clk', 'clockrate')
+
+RESET = template.Template(['# +-----------------------------------\n',
+                           '# | connection point _reset_\n',
+                           '# |\n',
+                           'add_interface _reset_ reset end\n',
+                           'set_interface_property _reset_ associatedClock _clk_\n',
+                           'set_interface_property _reset_ synchronousEdges _edges_\n',
+                           'set_interface_property _reset_ ENABLED true\n',
+                           'add_interface_port _reset_ _reset_ reset Input 1\n',
+                           '# |\n',
+                           '# +-----------------------------------\n\n'],
+                          'reset', 'clk', 'edges')
+
 # def keepline(line, keepsets):
 #     for key, s, value in keepsets:
 #         if s in line:
@@ -187,16 +206,10 @@ class ConnectionPoints(object):
 #     def interfacesignals(self, interface):
 #         return self.connectionpointslist[interface].interfacesignals()
 
-    def show(self):
-        global indent
+    def show(self, indent=0):
         print('Connection Points')
-        indent += 4
         for cp in self.connectionpointslist.values():
-            cp.show()
-        if indent > 4:
-            indent -= 4
-        else:
-            indent = 0
+            cp.show(indent + 4)
         print()
 
     def widthempty(self, key):
@@ -238,26 +251,14 @@ class Clock(ConnectionPoint):
         else:
             self.rate = 0
 
-    def show(self):
-        global indent
+    def show(self, indent=4):
         print('{:{width}}Connection Point {}: {} : {} Hz' .format(
             ' ', self.cptype, self.name, self.rate, width=indent))
 
     def tclconnectionpoint(self, tcltarget):
-        for line in ['# +-----------------------------------\n',
-                     '# | connection point _clk_\n',
-                     '# |\n',
-                     'add_interface _clk_ clock end\n',
-                     'set_interface_property _clk_ clockRate _clockrate_\n',
-                     'set_interface_property _clk_ ENABLED true\n',
-                     'add_interface_port _clk_ _clk_ clk Input 1\n',
-                     '# |\n',
-                     '# +-----------------------------------\n\n']:
-            line = string.replace(line, '_clk_', self.name)
-            line = string.replace(line, '_clockrate_', '{}'.format(self.rate))
-            tcltarget.write(line)
-
-    def elaborate(self, tcltarget):
+        CLOCK.write(tcltarget, clk=self.name, clockrate=self.rate)
+
+    def elaborate(self, tcltarget, derived):
         pass
 
 
@@ -272,34 +273,22 @@ class Reset(ConnectionPoint):
         if len(decl) > 2 and decl[2] is not None:
             self.synchronousedges = decl[2]
 
-    def show(self):
+    def show(self, indent=4):
         print('{:{width}}Connection Point {}: {}, associated clock: {}, edges: {}' .format(
             ' ', self.cptype, self.name, self.associatedclock, self.synchronousedges, width=indent))
 
     def tclconnectionpoint(self, tcltarget):
-        for line in ['# +-----------------------------------\n',
-                     '# | connection point _reset_\n',
-                     '# |\n',
-                     'add_interface _reset_ reset end\n',
-                     'set_interface_property _reset_ associatedClock _clk_\n',
-                     'set_interface_property _reset_ synchronousEdges _edges_\n',
-                     'set_interface_property _reset_ ENABLED true\n',
-                     'add_interface_port _reset_ _reset_ reset Input 1\n',
-                     '# |\n',
-                     '# +-----------------------------------\n\n']:
-            line = string.replace(line, '_reset_', self.name)
-            line = string.replace(line, '_clk_', self.associatedclock)
-            line = string.replace(
-                line, '_edges_', '{}'.format(self.synchronousedges))
-            tcltarget.write(line)
-
-    def elaborate(self, tcltarget):
+        RESET.write(tcltarget, reset=self.name, clk=self.associatedclock, edges=self.synchronousedges)
+
+    def elaborate(self, tcltarget, derived):
         pass
 
 
 class SinkSource(ConnectionPoint):
 
     def __init__(self, sinkorsource, genericslist, decl):
+        import Utilities.hdlutils as hdlutils
+
         ConnectionPoint.__init__(self)
         self.cptype = sinkorsource
         self.genericslist = genericslist
@@ -522,6 +511,8 @@ class SinkSource(ConnectionPoint):
 #         return r
 
     def makesignals(self):
+        import myhdl
+
         # add one for one
         data = None
         sop = None
@@ -556,8 +547,7 @@ class SinkSource(ConnectionPoint):
         # only return the necessary ones, or all?
         return data, sop, eop, empty, channel, error, valid, ready
 
-    def show(self):
-        global indent
+    def show(self, indent=4):
         print('{: >{width}}Connection Point {}: {}' .format(
             '', self.cptype, self.name, width=indent))
         indent += 4
@@ -580,7 +570,6 @@ class SinkSource(ConnectionPoint):
             print('{: >{width}}Error: {} WIDTH_ERROR: {}' .format(
                 '', self.error, self.WIDTH_ERROR, width=indent))
 
-        indent -= 4
 
     def tclconnectionpoint(self, tcltarget):
 
@@ -642,28 +631,28 @@ class SinkSource(ConnectionPoint):
 
         tcltarget.write('# |\n# +-----------------------------------\n\n')
 
-    def elaborate(self, tcltarget):
+    def elaborate(self, tcltarget, derived):
         tcltarget.write('\t#--- {} {}\n'
                         .format(self.cptype, self.name))
         if self.key_WIDTH_D:
             # find out if this a derived parameter, in which case the
             # 'elaborate' call has computed the value
             if self.genericslist.isderived(self.key_WIDTH_D):
-                tcltarget.write('\tset {0}_d_width [ lindex $l [expr [lsearch $l "{1}"] +1]]\n'
-                                .format(self.name, self.key_WIDTH_D))
+                tcltarget.write('\tset {0}_d_width {1}\n'
+                                .format(self.name, self.genericslist.tclderived(self.key_WIDTH_D)))
                 tcltarget.write('\tset_parameter_value {1} ${0}_d_width \n'
                                 .format(self.name, self.key_WIDTH_D))
-                # mark that the derived key has been used
-                self.genericslist.markderived(self.key_WIDTH_D)
+                # note that the derived key has been used
+                derived.add(self.key_WIDTH_D)
             else:
-                tcltarget.write('\tset {}_d_width [ get_parameter_value {} ]\n'
-                                .format(self.name, self.key_WIDTH_D))
+                tcltarget.write('\tset {}_d_width {}\n'
+                                .format(self.name, self.genericslist.tclvalue(self.key_WIDTH_D)))
 
             tcltarget.write('\tadd_interface_port {0} {1} data {2} ${0}_d_width\n'
                             .format(self.name, self.Data, 'Input' if self.cptype == 'Sink' else 'Output'))
             if self.key_SYMBOL_WIDTH_D:
-                tcltarget.write('\tset {}_d_symbol_width [ get_parameter_value {} ]\n'
-                                .format(self.name, self.key_SYMBOL_WIDTH_D))
+                tcltarget.write('\tset {}_d_symbol_width {}\n'
+                                .format(self.name, self.genericslist.tclvalue(self.key_SYMBOL_WIDTH_D)))
                 tcltarget.write('\tset_interface_property {0} dataBitsPerSymbol ${0}_d_symbol_width\n'
                                 .format(self.name))
                 tcltarget.write(
@@ -675,7 +664,7 @@ class SinkSource(ConnectionPoint):
                 tcltarget.write('\tset_interface_property {0} dataBitsPerSymbol ${0}_d_width \n'
                                 .format(self.name))
         if self.key_HANDSHAKE:
-            tcltarget.write('\tset hs [ get_parameter_value HANDSHAKE ]\n')
+            tcltarget.write('\tset hs {}\n'.format(self.genericslist.tclvalue(self.key_HANDSHAKE)))
             tcltarget.write('\tif {$hs == "Standard"} {\n')
             tcltarget.write('\t\tadd_interface_port {0} {1} valid {2} 1 \n'.format(
                 self.name, self.valid, 'Input' if self.cptype == 'Sink' else 'Output'))
@@ -704,8 +693,8 @@ class SinkSource(ConnectionPoint):
             tcltarget.write('\t}\n')
 
         if isinstance(self.key_USE_PACKETS, str):
-            tcltarget.write('\tset {}_usepackets [ get_parameter_value {} ]\n'
-                            .format(self.name, self.key_USE_PACKETS))
+            tcltarget.write('\tset {}_usepackets {}\n'
+                            .format(self.name, self.genericslist.tclvalue(self.key_USE_PACKETS)))
             tcltarget.write('\tif {{${}_usepackets}} {{\n'
                             .format(self.name))
             tcltarget.write('\t\tadd_interface_port {0} {1} startofpacket {3} 1\n\t\tadd_interface_port {0} {2} endofpacket {3} 1\n'
@@ -714,8 +703,8 @@ class SinkSource(ConnectionPoint):
                 if self.key_SYMBOL_WIDTH_D:
                     tcltarget.write('\t\tset_parameter_property {} ENABLED true\n'
                                     .format(self.key_USE_EMPTY))
-                    tcltarget.write('\t\tset {0}_useempty [ get_parameter_value {1} ]\n'
-                                    .format(self.name, self.key_USE_EMPTY))
+                    tcltarget.write('\t\tset {0}_useempty {1}\n'
+                                    .format(self.name, self.genericslist.tclvalue(self.key_USE_EMPTY)))
                     tcltarget.write('\t\tif {{${0}_useempty }} {{\n'
                                     .format(self.name))
                     tcltarget.write('\t\t\tadd_interface_port {0} {1} empty {2} {3}\n'
@@ -727,13 +716,13 @@ class SinkSource(ConnectionPoint):
             tcltarget.write('\t}\n')
 
         if self.key_USE_CHANNEL:
-            tcltarget.write('\tset {0}_use_channel [ get_parameter_value {1} ]\n' .format(
-                self.name, self.key_USE_CHANNEL))
+            tcltarget.write('\tset {0}_use_channel {1}\n' .format(
+                self.name, self.genericslist.tclvalue(self.key_USE_CHANNEL)))
             tcltarget.write('\tif {{${0}_use_channel}} {{\n'.format(self.name))
             tcltarget.write(
                 '\t\tset_parameter_property {0} ENABLED true\n'.format(self.key_MAX_CHANNEL))
-            tcltarget.write('\t\tset {0}_channel_max [get_parameter_value {1} ]\n' .format(
-                self.name, self.key_MAX_CHANNEL))
+            tcltarget.write('\t\tset {0}_channel_max {1}\n' .format(
+                self.name, self.genericslist.tclvalue(self.key_MAX_CHANNEL)))
             tcltarget.write('\t\t\tadd_interface_port {0} {1} channel {2} [log2ceiling ${0}_channel_max]\n'
                             .format(self.name, self.channel, 'Input' if self.cptype == 'Sink' else 'Output'))
             tcltarget.write('\t} else {\n')
@@ -745,15 +734,15 @@ class SinkSource(ConnectionPoint):
             # find out if this a derived parameter, in which case the
             # 'elaborate' call has computed the value
             if self.genericslist.isderived(self.key_WIDTH_ERROR):
-                tcltarget.write('\tset {0}_error_width [ lindex $l [expr [lsearch $l "{1}"] +1]]\n'
-                                .format(self.name, self.key_WIDTH_ERROR))
+                tcltarget.write('\tset {0}_error_width {1}\n'
+                                .format(self.name, self.genericslist.tclderived(self.key_WIDTH_ERROR)))
                 tcltarget.write('\tset_parameter_value {1} ${0}_error_width \n'
                                 .format(self.name, self.key_WIDTH_ERROR))
-                # mark that the derived key has been used
-                self.genericslist.markderived(self.key_WIDTH_ERROR)
+                # note that the derived key has been used
+                derived.add(self.key_WIDTH_ERROR)
             else:
-                tcltarget.write('\tset {}_error_width [ get_parameter_value {} ]\n'
-                                .format(self.name, self.key_WIDTH_ERROR))
+                tcltarget.write('\tset {}_error_width {}\n'
+                                .format(self.name, self.genericslist.tclvalue(self.key_WIDTH_ERROR)))
 
             tcltarget.write(
                 '\tif {{${0}_error_width > 0}} {{\n'.format(self.name))
@@ -764,6 +753,8 @@ class SinkSource(ConnectionPoint):
 class MMSlaveMaster(ConnectionPoint):
 
     def __init__(self, slaveormaster, genericslist, decl):
+        import Utilities.hdlutils as hdlutils
+
         ConnectionPoint.__init__(self)
         self.cptype = slaveormaster
         self.genericslist = genericslist
@@ -991,6 +982,8 @@ class MMSlaveMaster(ConnectionPoint):
 #         return r
 
     def makesignals(self):
+        import myhdl
+
         A = None
         WD = None
         Wr = None
@@ -1028,8 +1021,7 @@ class MMSlaveMaster(ConnectionPoint):
 
         return A, WD, Wr, Rd, RQ, WaitRequest, ReadDataValid, BurstCount, ByteEnables
 
-    def show(self):
-        global indent
+    def show(self, indent=4):
         print('{:{width}}Connection Point {}: {}' .format(
             ' ', self.cptype, self.name, width=indent))
         indent += 4
@@ -1061,7 +1053,6 @@ class MMSlaveMaster(ConnectionPoint):
         if self.BRIDGES_TO_MASTER:
             print('{:{width}}BridgesToMaster: {}' .format(
                 ' ', self.BRIDGES_TO_MASTER, width=indent))
-        indent -= 4
 
     def tclconnectionpoint(self, tcltarget):
 
@@ -1163,80 +1154,80 @@ class MMSlaveMaster(ConnectionPoint):
                         '# |\n' +
                         '# +-----------------------------------\n\n')
 
-    def elaborate(self, tcltarget):
+    def elaborate(self, tcltarget, derived):
         tcltarget.write('\t#--- {} {}\n'.format(self.cptype, self.name))
         if self.key_BURST_ON_BURST_BOUNDARIES_ONLY:
-            tcltarget.write('\tset {}_bobbo [get_parameter_value {}]\n'
-                            .format(self.name, self.key_BURST_ON_BURST_BOUNDARIES_ONLY))
+            tcltarget.write('\tset {}_bobbo {}\n'
+                            .format(self.name, self.genericslist.tclvalue(self.key_BURST_ON_BURST_BOUNDARIES_ONLY)))
             tcltarget.write('\tset_interface_property {0} burstOnBurstBoundariesOnly ${0}_bobbo\n'
                             .format(self.name))
 
         if self.key_HOLD_TIME:
-            tcltarget.write('\tset {}_ht [get_parameter_value {}]\n'
-                            .format(self.name, self.key_HOLD_TIME))
+            tcltarget.write('\tset {}_ht {}\n'
+                            .format(self.name, self.genericslist.tclvalue(self.key_HOLD_TIME)))
             tcltarget.write('\tset_interface_property {0} holdTime ${0}_ht\n'
                             .format(self.name))
 
         if self.key_LINE_WRAP_BURSTS:
-            tcltarget.write('\tset {}_lwb [get_parameter_value {}]\n'
-                            .format(self.name, self.key_LINE_WRAP_BURSTS))
+            tcltarget.write('\tset {}_lwb {}\n'
+                            .format(self.name, self.genericslist.tclvalue(self.key_LINE_WRAP_BURSTS)))
             tcltarget.write('\tset_interface_property {0} holdTime ${0}_lwb\n'
                             .format(self.name))
 
         if self.key_MAXIMUM_PENDING_READ_TRANSACTIONS:
-            tcltarget.write('\tset {}_mprt [get_parameter_value {}]\n'
-                            .format(self.name, self.key_MAXIMUM_PENDING_READ_TRANSACTIONS))
+            tcltarget.write('\tset {}_mprt {}\n'
+                            .format(self.name, self.genericslist.tclvalue(self.key_MAXIMUM_PENDING_READ_TRANSACTIONS)))
             tcltarget.write('\tset_interface_property {0} maximumPendingReadTransactions ${0}_mprt\n'
                             .format(self.name))
 
         if self.key_READ_LATENCY:
-            tcltarget.write('\tset {}_rl [get_parameter_value {}]\n'
-                            .format(self.name, self.key_READ_LATENCY))
+            tcltarget.write('\tset {}_rl {}\n'
+                            .format(self.name, self.genericslist.tclvalue(self.key_READ_LATENCY)))
             tcltarget.write('\tset_interface_property {0} readLatency ${0}_rl\n'
                             .format(self.name))
 
         if self.key_READ_WAIT_TIME:
-            tcltarget.write('\tset {}_rwt [get_parameter_value {}]\n'
-                            .format(self.name, self.key_READ_WAIT_TIME))
+            tcltarget.write('\tset {}_rwt {}\n'
+                            .format(self.name, self.genericslist.tclvalue(self.key_READ_WAIT_TIME)))
             tcltarget.write('\tset_interface_property {0} readWaitTime ${0}_rwt\n'
                             .format(self.name))
 
         if self.key_SETUP_TIME:
-            tcltarget.write('\tset {}_sut [get_parameter_value {}]\n'
-                            .format(self.name, self.key_SETUP_TIME))
+            tcltarget.write('\tset {}_sut {}\n'
+                            .format(self.name, self.genericslist.tclvalue(self.key_SETUP_TIME)))
             tcltarget.write('\tset_interface_property {0} setupTime ${0}_sut\n'
                             .format(self.name))
 
         if self.key_WRITE_WAIT_TIME:
-            tcltarget.write('\tset {}_wwt [get_parameter_value {}]\n'
-                            .format(self.name, self.key_WRITE_WAIT_TIME))
+            tcltarget.write('\tset {}_wwt {}\n'
+                            .format(self.name, self.genericslist.tclvalue(self.key_WRITE_WAIT_TIME)))
             tcltarget.write('\tset_interface_property {0} writeWaitTime ${0}_wwt\n'
                             .format(self.name))
 
         if self.key_BRIDGES_TO_MASTER and self.cptype == 'MMSlave':
-            tcltarget.write('\tset {}_btm [get_parameter_value {}]\n'
-                            .format(self.name, self.key_BRIDGES_TO_MASTER))
+            tcltarget.write('\tset {}_btm {}\n'
+                            .format(self.name, self.genericslist.tclvalue(self.key_BRIDGES_TO_MASTER)))
             tcltarget.write('\tset_interface_property {0} bridgesToMaster ${0}_btm\n'
                             .format(self.name))
 
         if self.key_WIDTH_A:
             if self.genericslist.isderived(self.key_WIDTH_A):
-                tcltarget.write('\tset {0}_a_width [ lindex $l [expr [lsearch $l "{1}"] +1]]\n'
-                                .format(self.name, self.key_WIDTH_A))
+                tcltarget.write('\tset {0}_a_width {1}\n'
+                                .format(self.name, self.genericslist.tclderived(self.key_WIDTH_A)))
                 tcltarget.write('\tset_parameter_value {1} ${0}_a_width \n'
                                 .format(self.name, self.key_WIDTH_A))
-                # mark that the derived key has been used
-                self.genericslist.markderived(self.key_WIDTH_A)
+                # note that the derived key has been used
+                derived.add(self.key_WIDTH_A)
             else:
-                tcltarget.write('\tset {}_a_width [get_parameter_value {}]\n'
-                                .format(self.name, self.key_WIDTH_A))
+                tcltarget.write('\tset {}_a_width {}\n'
+                                .format(self.name, self.genericslist.tclvalue(self.key_WIDTH_A)))
 
             tcltarget.write('\tadd_interface_port {0} {1} address {2} ${0}_a_width\n'
                             .format(self.name, self.address, 'Input' if self.cptype == 'MMSlave' else 'Output'))
 
         if self.key_WIDTH_MM_D:
-            tcltarget.write('\tset {}_dwidth [get_parameter_value {}]\n'
-                            .format(self.name, self.key_WIDTH_MM_D))
+            tcltarget.write('\tset {}_dwidth {}\n'
+                            .format(self.name, self.genericslist.tclvalue(self.key_WIDTH_MM_D)))
             if self.wr:
                 tcltarget.write('\tadd_interface_port {0} {1} readdata {2} ${0}_dwidth\n'.format(
                     self.name, self.readdata, 'Input' if self.cptype == 'MMMaster' else 'Output'))
@@ -1246,13 +1237,13 @@ class MMSlaveMaster(ConnectionPoint):
 
         if self.burstcount and self.key_MAXIMUM_BURSTCOUNT:
             if self.key_WIDTH_BURSTCOUNT:
-                tcltarget.write('\tset {}_wbc [get_parameter_value {}]\n'
-                                .format(self.name, self.key_WIDTH_BURSTCOUNT))
+                tcltarget.write('\tset {}_wbc {}\n'
+                                .format(self.name, self.genericslist.tclvalue(self.key_WIDTH_BURSTCOUNT)))
                 tcltarget.write('\tadd_interface_port {0} {1} burstcount {2} ${0}_wbc\n'
                                 .format(self.name, self.burstcount, 'Input' if self.cptype == 'MMSlave' else 'Output'))
             else:
-                tcltarget.write('\tset {}_mbc [get_parameter_value {}]\n'
-                                .format(self.name, self.key_MAXIMUM_BURSTCOUNT))
+                tcltarget.write('\tset {}_mbc {}\n'
+                                .format(self.name, self.genericslist.tclvalue(self.key_MAXIMUM_BURSTCOUNT)))
                 tcltarget.write('\tadd_interface_port {0} {1} burstcount {2} $[log2ceiling {0}_mbc]\n'
                                 .format(self.name, self.burstcount, 'Input' if self.cptype == 'MMSlave' else 'Output'))
 
@@ -1291,6 +1282,8 @@ class Conduit(ConnectionPoint):
             self.siglist.append((sig[0], sig[1], sig[2], sig_key, sig_val))
 
     def makesignals(self):
+        import myhdl
+
         sigs = []
         for sig in self.siglist:
             if sig[3] is not None:
@@ -1300,15 +1293,13 @@ class Conduit(ConnectionPoint):
                 sigs.append(myhdl.Signal(myhdl.intbv(0)[sig[4]:]))
         return sigs if len(sigs) > 1 else sigs[0]
 
-    def show(self):
-        global indent
+    def show(self, indent=4):
         print('{:{width}}Connection Point {}: {}, associated clock: {}, associated reset: {}' .format(
             ' ', self.cptype, self.name, self.associatedclock, self.associatedreset, width=indent))
         indent += 4
         for item in self.siglist:
             print('{:{width}}{} {} {}' .format(
                 ' ', item[0], item[1], item[2], width=indent))
-        indent -= 4
 
     def tclconnectionpoint(self, tcltarget):
         tcltarget.write('# +-----------------------------------\n')
@@ -1339,19 +1330,20 @@ class Conduit(ConnectionPoint):
                         '# |\n' +
                         '# +-----------------------------------\n\n')
 
-    def elaborate(self, tcltarget):
+    def elaborate(self, tcltarget, derived):
         tcltarget.write('\t#--- {} {}\n'.format(self.cptype, self.name))
         for sig in self.siglist:
             if sig[3] is not None:
                 # looking up
                 if self.genericslist.isderived(sig[3]):
-                    tcltarget.write('\tset {0}_{1} [ lindex $l [expr [lsearch $l "{2}"] +1]]\n'
-                                    .format(self.name, sig[0], sig[3]))
-                    tcltarget.write('\tset_parameter_value {2} ${0}-{1} \n'
+                    tcltarget.write('\tset {0}_{1} {2}\n'
+                                    .format(self.name, sig[0], self.genericslist.tclderived(sig[3])))
+                    tcltarget.write('\tset_parameter_value {2} ${0}_{1} \n'
                                     .format(self.name, sig[0], sig[3]))
+                    derived.add(sig[3])
                 else:
-                    tcltarget.write('\tset {}_{} [get_parameter_value {}]\n'
-                                    .format(self.name, sig[0], sig[3]))
+                    tcltarget.write('\tset {}_{} {}\n'
+                                    .format(self.name, sig[0], self.genericslist.tclvalue(sig[3])))
                     # add_interface_port SequenceB SequenceTimeB export Output
                     # 16
                     print(sig)
@@ -0,0 +1,314 @@
+#  This file is part of the Qgen utility, a Python package for
+#  extending the MyHDL package
+#
+#  Copyright (C) 2014-2015 Josy Boelen
+#
+#  The Qgen utility is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public License as
+#  published by the Free Software Foundation; either version 3.0 of the
+#  License, or (at your option) any later version.
+#
+#  This utility is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+'''
+declarative derived generics
+
+a derived generic can be given a small expression instead of a plain True:
+    ('WIDTH_ELEMENT', ('Natural', 8, (1, 4096)), 'WIDTH_DQ / SWAPS if WIDTH_DQ % SWAPS == 0 else 0')
+or an expression and a validity check:
+    ('WIDTH_ELEMENT', ('Natural', 8, (1, 4096)), ('WIDTH_DQ / SWAPS', 'WIDTH_DQ % SWAPS == 0'))
+
+the expression is evaluated in Python and compiled into a Tcl [expr ...] in the Elaborate callback,
+so Qsys doesn't have to call upon Python for it
+
+the allowed syntax is a restricted Python expression:
+    integer literals, True, False, names of (previously declared) generics
+    + - * / // % ** << >> & | ^ ~, comparisons, and, or, not, x if c else y
+    min(), max(), abs(), log2ceiling()
+'/' is an integer division, as it is in Tcl (and for VHDL naturals)
+'''
+
+from __future__ import print_function
+
+import ast
+import itertools
+
+import Utilities.Qgen.qerror as qerror
+
+
+def log2ceiling(num):
+    ''' the same as the log2ceiling proc in the _hw.tcl '''
+    val = 0
+    i = 1
+    while i < num:
+        val += 1
+        i = 1 << val
+    if val == 0:
+        val = 1
+    return val
+
+
+BINOPS = {ast.Add: ('+', lambda a, b: a + b),
+          ast.Sub: ('-', lambda a, b: a - b),
+          ast.Mult: ('*', lambda a, b: a * b),
+          ast.Div: ('/', lambda a, b: a // b),
+          ast.FloorDiv: ('/', lambda a, b: a // b),
+          ast.Mod: ('%', lambda a, b: a % b),
+          ast.Pow: ('**', lambda a, b: a ** b),
+          ast.LShift: ('<<', lambda a, b: a << b),
+          ast.RShift: ('>>', lambda a, b: a >> b),
+          ast.BitAnd: ('&', lambda a, b: a & b),
+          ast.BitOr: ('|', lambda a, b: a | b),
+          ast.BitXor: ('^', lambda a, b: a ^ b)}
+
+UNARYOPS = {ast.USub: ('-', lambda a: -a),
+            ast.UAdd: ('+', lambda a: +a),
+            ast.Invert: ('~', lambda a: ~a),
+            ast.Not: ('!', lambda a: not a)}
+
+COMPAREOPS = {ast.Eq: ('==', lambda a, b: a == b),
+              ast.NotEq: ('!=', lambda a, b: a != b),
+              ast.Lt: ('<', lambda a, b: a < b),
+              ast.LtE: ('<=', lambda a, b: a <= b),
+              ast.Gt: ('>', lambda a, b: a > b),
+              ast.GtE: ('>=', lambda a, b: a >= b)}
+
+FUNCTIONS = {'min': min, 'max': max, 'abs': abs, 'log2ceiling': log2ceiling}
+
+
+def constant(node):
+    ''' returns (True, value) for a literal, (False, None) otherwise '''
+    if isinstance(node, ast.Name) and node.id in ('True', 'False'):
+        # Python 2
+        return True, node.id == 'True'
+    if hasattr(ast, 'Constant') and isinstance(node, ast.Constant):
+        return True, node.value
+    if hasattr(ast, 'NameConstant') and isinstance(node, ast.NameConstant):
+        return True, node.value
+    if isinstance(node, ast.Num):
+        return True, node.n
+    return False, None
+
+
+class Expression(object):
+    ''' a derived-parameter expression, with an optional validity check '''
+
+    def __init__(self, text, check=None):
+        self.text = text
+        self.tree = self.parse(text)
+        self.checktext = check
+        self.checktree = self.parse(check) if check is not None else None
+        self.names = []
+        for tree in (self.tree, self.checktree):
+            if tree is not None:
+                self.collectnames(tree, self.names)
+
+    def parse(self, text):
+        try:
+            tree = ast.parse(text.strip(), mode='eval').body
+        except SyntaxError as exc:
+            raise qerror.QError('Invalid expression \'{}\': {}'.format(text, exc))
+        self.validate(tree, text)
+        return tree
+
+    def validate(self, node, text):
+        isconstant, value = constant(node)
+        if isconstant:
+            if isinstance(value, (bool, int)) or type(value).__name__ == 'long':
+                return
+        elif isinstance(node, ast.Name):
+            return
+        elif isinstance(node, ast.BinOp) and type(node.op) in BINOPS:
+            self.validate(node.left, text)
+            self.validate(node.right, text)
+            return
+        elif isinstance(node, ast.UnaryOp) and type(node.op) in UNARYOPS:
+            self.validate(node.operand, text)
+            return
+        elif isinstance(node, ast.BoolOp):
+            for item in node.values:
+                self.validate(item, text)
+            return
+        elif isinstance(node, ast.Compare) and all(type(op) in COMPAREOPS for op in node.ops):
+            for item in [node.left] + node.comparators:
+                self.validate(item, text)
+            return
+        elif isinstance(node, ast.IfExp):
+            for item in (node.test, node.body, node.orelse):
+                self.validate(item, text)
+            return
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS \
+                and not node.keywords and getattr(node, 'starargs', None) is None \
+                and getattr(node, 'kwargs', None) is None:
+            for item in node.args:
+                self.validate(item, text)
+            return
+
+        raise qerror.QError('Unsupported construct in expression \'{}\': {}'
+                            .format(text, type(node).__name__))
+
+    def collectnames(self, node, names):
+        if isinstance(node, ast.Name) and not constant(node)[0]:
+            if node.id not in names:
+                names.append(node.id)
+        elif isinstance(node, ast.Call):
+            for item in node.args:
+                self.collectnames(item, names)
+        else:
+            for child in ast.iter_child_nodes(node):
+                self.collectnames(child, names)
+
+    def evaluate(self, values, node=None):
+        ''' values: dictionary of the generics' (Python) values '''
+        node = self.tree if node is None else node
+        isconstant, value = constant(node)
+        if isconstant:
+            return value
+        if isinstance(node, ast.Name):
+            return values[node.id]
+        if isinstance(node, ast.BinOp):
+            return BINOPS[type(node.op)][1](self.evaluate(values, node.left),
+                                           self.evaluate(values, node.right))
+        if isinstance(node, ast.UnaryOp):
+            return UNARYOPS[type(node.op)][1](self.evaluate(values, node.operand))
+        if isinstance(node, ast.BoolOp):
+            # short-circuit, as Tcl does
+            isand = isinstance(node.op, ast.And)
+            for item in node.values:
+                if bool(self.evaluate(values, item)) != isand:
+                    return not isand
+            return isand
+        if isinstance(node, ast.Compare):
+            left = self.evaluate(values, node.left)
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self.evaluate(values, comparator)
+                if not COMPAREOPS[type(op)][1](left, right):
+                    return False
+                left = right
+            return True
+        if isinstance(node, ast.IfExp):
+            if self.evaluate(values, node.test):
+                return self.evaluate(values, node.body)
+            return self.evaluate(values, node.orelse)
+        # must be a call
+        return FUNCTIONS[node.func.id](*[self.evaluate(values, item) for item in node.args])
+
+    def check(self, values):
+        ''' returns True if there is no check, or it holds for these values '''
+        if self.checktree is None:
+            return True
+        return bool(self.evaluate(values, self.checktree))
+
+    def tcl(self, lookup=None, node=None):
+        ''' the Tcl expr equivalent (to put between the braces of an 'expr {}')
+            lookup(name) returns the Tcl text to fetch a generic's value
+        '''
+        lookup = lookup or '[get_parameter_value {}]'.format
+        node = self.tree if node is None else node
+        isconstant, value = constant(node)
+        if isconstant:
+            if isinstance(value, bool):
+                return '1' if value else '0'
+            return '{}'.format(value)
+        if isinstance(node, ast.Name):
+            return lookup(node.id)
+        if isinstance(node, ast.BinOp):
+            return '({} {} {})'.format(self.tcl(lookup, node.left), BINOPS[type(node.op)][0],
+                                       self.tcl(lookup, node.right))
+        if isinstance(node, ast.UnaryOp):
+            return '({}{})'.format(UNARYOPS[type(node.op)][0], self.tcl(lookup, node.operand))
+        if isinstance(node, ast.BoolOp):
+            op = ' && ' if isinstance(node.op, ast.And) else ' || '
+            return '({})'.format(op.join(self.tcl(lookup, item) for item in node.values))
+        if isinstance(node, ast.Compare):
+            terms = []
+            left = node.left
+            for op, comparator in zip(node.ops, node.comparators):
+                terms.append('({} {} {})'.format(self.tcl(lookup, left), COMPAREOPS[type(op)][0],
+                                                 self.tcl(lookup, comparator)))
+                left = comparator
+            return terms[0] if len(terms) == 1 else '({})'.format(' && '.join(terms))
+        if isinstance(node, ast.IfExp):
+            return '({} ? {} : {})'.format(self.tcl(lookup, node.test), self.tcl(lookup, node.body),
+                                           self.tcl(lookup, node.orelse))
+        # must be a call
+        args = [self.tcl(lookup, item) for item in node.args]
+        if node.func.id == 'log2ceiling':
+            return '[log2ceiling [expr {{{}}}]]'.format(args[0])
+        return '{}({})'.format(node.func.id, ', '.join(args))
+
+    def tclcheck(self, lookup=None):
+        return self.tcl(lookup, self.checktree)
+
+
+def crosscheck(generics, limit=64):
+    ''' the differential test: evaluate every expression-derived generic both in Python and in Tcl
+        for the allowed values of the generics it depends upon
+        returns a list of (generic, values, python result, tcl result) mismatches
+    '''
+    try:
+        import Tkinter as tkinter
+        from StringIO import StringIO
+    except ImportError:
+        import tkinter
+        from io import StringIO
+    import Utilities.Qgen.generate as generate
+
+    tcl = tkinter.Tcl()
+    utility = StringIO()
+    generate.HwTclUtility(utility)
+    tcl.eval(utility.getvalue())
+    tcl.eval('proc get_parameter_value { name } { return $::param($name) }')
+
+    mismatches = []
+    for key, generic in generics.genericlist.items():
+        if generic.expression is None:
+            continue
+        inputs, chain = generics.expressionchain(key)
+        for combination in itertools.product(*[generics.genericlist[name].allowedvalues(limit)
+                                                for name in inputs]):
+            values = dict(zip(inputs, combination))
+            # as Python does it
+            try:
+                pythonvalues = dict(values)
+                for name in chain:
+                    pythonvalues[name] = generics.genericlist[name].expression.evaluate(pythonvalues)
+                pythonresult = pythonvalues[key]
+            except ZeroDivisionError:
+                pythonresult = None
+            # as the Elaborate callback does it
+            try:
+                for name, value in values.items():
+                    tcl.setvar('param({})'.format(name),
+                               ('true' if value else 'false') if isinstance(value, bool) else value)
+                for name in chain:
+                    tclresult = tcl.eval('expr {{{}}}'.format(generics.genericlist[name].expression.tcl()))
+                    tcl.setvar('param({})'.format(name), tclresult)
+            except tkinter.TclError:
+                tclresult = None
+
+            if pythonresult is None or tclresult is None:
+                same = pythonresult is None and tclresult is None
+            elif isinstance(pythonresult, bool):
+                same = pythonresult == tcl.getboolean(tclresult)
+            else:
+                same = '{}'.format(pythonresult) == tclresult
+            if not same:
+                mismatches.append((key, values, pythonresult, tclresult))
+
+    return mismatches
+
+
+if __name__ == '__main__':
+    # ''' here we add some tests '''
+    e = Expression('WIDTH_DQ / SWAPS if WIDTH_DQ % SWAPS == 0 else 0')
+    print(e.names, e.evaluate({'WIDTH_DQ': 32, 'SWAPS': 4}), e.tcl())
+    e = Expression('log2ceiling(MAX_CHANNEL + 1) if USE_CHANNEL and 0 < MAX_CHANNEL <= 255 else 1')
+    print(e.names, e.evaluate({'MAX_CHANNEL': 3, 'USE_CHANNEL': True}), e.tcl())
@@ -0,0 +1,201 @@
+#  This file is part of the Qgen utility, a Python package for
+#  extending the MyHDL package
+#
+#  Copyright (C) 2014-2015 Josy Boelen
+#
+#  The Qgen utility is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public License as
+#  published by the Free Software Foundation; either version 3.0 of the
+#  License, or (at your option) any later version.
+#
+#  This utility is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+'''
+the startup fast path for the Qsys Elaborate callback
+
+keep this module light: it must not import MyHDL (or argparse)
+the elaborate function can live in a module of its own, without any HDL imports,
+and be named as 'module:function', e.g. 'ST_elementswap_elaborate:elaborate'
+
+    python -m Utilities.Qgen.fastpath ST_elementswap_elaborate:elaborate --QsysElaborate WIDTH_DQ 32 SWAPS 4
+
+the _hw.tcl sends the parameters on stdin, as a 'qgen/1' line followed by NAME=VALUE lines,
+and reads the response in the same format (see parameters() and respond()):
+    python -m Utilities.Qgen.fastpath ST_elementswap_elaborate:elaborate --QsysElaborate - < request.txt
+
+to look the result up in the persistent elaborate cache (at most 4096 entries) first:
+    python -m Utilities.Qgen.fastpath --cache 4096 ST_elementswap_elaborate:elaborate --QsysElaborate WIDTH_DQ 32 SWAPS 4
+
+to check the latency against LATENCY_TARGET:
+    python -m Utilities.Qgen.fastpath --checklatency ST_elementswap_elaborate:elaborate WIDTH_DQ 32 SWAPS 4
+'''
+
+from __future__ import print_function
+
+import re
+import sys
+import importlib
+
+# the time we allow a single Elaborate call to take, in seconds
+LATENCY_TARGET = 0.050
+
+# the first line of a request and of a response, NAME=VALUE lines follow
+PROTOCOL = 'qgen/1'
+
+
+def qsyselaborateargs(argv):
+    ''' returns the parameter list if argv is a plain Qsys Elaborate call, else None
+        the _hw.tcl always puts --QsysElaborate first, anything else goes through argparse
+    '''
+    if argv and argv[0] in ('-e', '--QsysElaborate'):
+        return argv[1:]
+    return None
+
+
+def resolve(spec):
+    ''' turns 'module:function' into the function '''
+    if callable(spec):
+        return spec
+    modulename, _, functionname = spec.partition(':')
+    return getattr(importlib.import_module(modulename), functionname or 'elaborate')
+
+
+def qsysvalue(value):
+    ''' a parameter value as Qsys hands it to us '''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return '{}'.format(value)
+
+
+def escape(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def unescape(text):
+    return re.sub(r'\\(.)', lambda match: '\n' if match.group(1) == 'n' else match.group(1), text)
+
+
+def encode(pairs):
+    ''' NAME=VALUE lines, a backslash and a newline in the value are escaped '''
+    return ''.join('{}={}\n'.format(name, escape(qsysvalue(value))) for name, value in pairs)
+
+
+def decode(lines):
+    pairs = []
+    for line in lines:
+        name, separator, value = line.partition('=')
+        if separator:
+            pairs.append((name, unescape(value)))
+    return pairs
+
+
+def parameters(qsysargs):
+    ''' returns the parameter dictionary and whether the request came in the key/value format:
+        '-' reads the request from stdin, '@file' from a file,
+        anything else are the NAME value pairs on the command line of the older _hw.tcl files
+    '''
+    if len(qsysargs) == 1 and (qsysargs[0] == '-' or qsysargs[0].startswith('@')):
+        if qsysargs[0] == '-':
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(qsysargs[0][1:], 'r') as source:
+                lines = source.read().splitlines()
+        if not lines or lines[0].strip() != PROTOCOL:
+            import Utilities.Qgen.qerror as qerror
+            raise qerror.QError('Expected a {} request, got {}'.format(PROTOCOL, lines[:1]))
+        return dict(decode(lines[1:])), True
+
+    # qsysarguments contains all the parameters with the currently assigned values (in the Qsys GUI)
+    # use a dictionary to pair the arguments
+    return dict(zip(qsysargs[0::2], qsysargs[1::2])), False
+
+
+def respond(result, target=None, metadata=None):
+    ''' write the result of the elaborate function (NAME, value, NAME, value ...) in the key/value format
+        metadata goes in as @NAME=value
+        target: None for sys.stdout as it is at the time of the call (the server swaps it for every request)
+    '''
+    target = target or sys.stdout
+    target.write(PROTOCOL + '\n')
+    target.write(encode(zip(result[0::2], result[1::2])))
+    if metadata:
+        target.write(encode(('@' + name, value) for name, value in sorted(metadata.items())))
+
+
+def elaborate(function, qsysargs, target=None, cache=None):
+    ''' call the elaborate function with the parameters and write the result for the Tcl code
+        returns the parameters and what we tell about the call (the cache outcome)
+        target: as for respond()
+        cache: the maximum number of entries in the persistent elaborate cache, None to always call the function
+    '''
+    target = target or sys.stdout
+    qsysargdict, keyvalue = parameters(qsysargs)
+    function = resolve(function)
+    metadata = {}
+    if cache is None:
+        result = function(qsysargdict)
+    else:
+        import Utilities.Qgen.cache as elaboratecache
+        store = elaboratecache.ElaborateCache(maxentries=cache)
+        key = store.key(function, qsysargdict)
+        cached = store.get(key)
+        if cached is None:
+            result = function(qsysargdict)
+            store.put(key, encode(zip(result[0::2], result[1::2])))
+            metadata['cache'] = 'miss'
+        else:
+            result = tuple(item for pair in decode(cached.splitlines()) for item in pair)
+            metadata['cache'] = 'hit'
+
+    if keyvalue:
+        respond(result, target, metadata)
+    else:
+        # the older _hw.tcl files pick the printed tuple apart
+        print(result, file=target)
+    return qsysargdict, metadata
+
+
+def measure(command, runs=11):
+    ''' returns the median wall-clock time of running command, in seconds '''
+    import subprocess
+    import time
+    import os
+
+    durations = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.check_call(command, stdout=devnull)
+            durations.append(time.time() - start)
+    durations.sort()
+    return durations[len(durations) // 2]
+
+
+def checklatency(spec, qsysargs, target=LATENCY_TARGET, runs=11):
+    ''' the fast path must answer within target seconds, else raise a QError '''
+    import Utilities.Qgen.qerror as qerror
+
+    # in a fresh interpreter, exactly as the _hw.tcl calls upon us
+    command = [sys.executable, '-m', 'Utilities.Qgen.fastpath', spec, '--QsysElaborate'] + list(qsysargs)
+    latency = measure(command, runs)
+    if latency > target:
+        raise qerror.QError('Elaborate took {:.1f} ms, target is {:.1f} ms'
+                            .format(latency * 1000, target * 1000))
+    return latency
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--checklatency':
+        print('Elaborate: {:.1f} ms'.format(checklatency(sys.argv[2], sys.argv[3:]) * 1000))
+    elif len(sys.argv) > 2 and sys.argv[1] == '--cache':
+        elaborate(sys.argv[3], qsyselaborateargs(sys.argv[4:]) or [], cache=int(sys.argv[2]))
+    else:
+        elaborate(sys.argv[1], qsyselaborateargs(sys.argv[2:]) or [])
+    sys.exit(0)
@@ -30,21 +30,35 @@ splitting a large source file into more manageable pieces
 from __future__ import print_function
 
 import sys
-import string
+import os
+import re
+import glob
+import shutil
+import filecmp
 import time
+import itertools
+import threading
+import py_compile
 
+import Utilities.Qgen.fastpath as fastpath
+import Utilities.Qgen.cache as cache
+import Utilities.Qgen.template as template
 
-def HwTclHeader(tcltarget, name, version, author, group, elaborate):
+# py_compile writes the .pyc in place, two threads writing the _hw.tcl of one component take turns
+compilelock = threading.Lock()
+
+
+def HwTclHeader(tcltarget, name, version, author, group, elaborate, filesets=False, timestamp=True):
     ''' write the header'''
 
     tcltarget.write(
         '# {}_hw.tcl generated by C-Cam Technologies\n'.format(name))
-    # add a timestamp
-    tcltarget.write(
-        '# {}'.format(time.strftime('UTC: %d/%m/%Y %H:%M\n', time.gmtime(time.time()))))
+    if timestamp:
+        tcltarget.write(
+            '# {}'.format(time.strftime('UTC: %d/%m/%Y %H:%M\n', time.gmtime(time.time()))))
     tcltarget.write('# Do Not Modify -- or at your own risk :)\n\n')
     # replace _toplevelname_, _author_, _group_
-    for line in ['package require -exact sopc 11.0\n',
+    for line in ['package require -exact qsys 13.1\n' if filesets else 'package require -exact sopc 11.0\n',
                  '\n',
                  '#\n',
                  '# module _toplevelname_\n',
@@ -67,8 +81,16 @@ def HwTclHeader(tcltarget, name, version, author, group, elaborate):
     if elaborate:
         tcltarget.write('set_module_property ELABORATION_CALLBACK Elaborate\n')
 
-    for line in ['set_module_property GENERATION_CALLBACK Generate\n',
-                 '\n',
+    if filesets:
+        # Qsys asks for every file set separately, VHDL ones share a conversion
+        tcltarget.write('\n'
+                        'add_fileset QUARTUS_SYNTH QUARTUS_SYNTH GenerateSynthesis\n'
+                        'add_fileset SIM_VHDL SIM_VHDL GenerateSimVHDL\n'
+                        'add_fileset SIM_VERILOG SIM_VERILOG GenerateSimVerilog\n')
+    else:
+        tcltarget.write('set_module_property GENERATION_CALLBACK Generate\n')
+
+    for line in ['\n',
                  '# +----------------------------------- \n',
                  '# | parameters\n',
                  '# |\n',
@@ -89,22 +111,20 @@ def HwTclDisplayItems(tcltarget):
                     '\n')
 
 
-def HwTclopenproc(tcltarget, name):
-    openproc = ['# +----------------------------------------------------------------\n',
-                '# | _proc_ callback\n',
-                'proc _proc_ {} {\n']
-    for line in openproc:
-        line = string.replace(line, '_proc_', name)
-        tcltarget.write(line)
+OPENPROC = template.Template(['# +----------------------------------------------------------------\n',
+                              '# | _proc_ callback\n',
+                              'proc _proc_ {_arguments_} {\n'],
+                             'proc', 'arguments')
+
+
+def HwTclopenproc(tcltarget, name, arguments=''):
+    OPENPROC.write(tcltarget, proc=name, arguments=arguments)
 
 
 def HwTclcloseproc(tcltarget):
-    closeproc = ['}\n',
-                 '# |\n',
-                 '# +-----------------------------------\n\n'
-                ]
-    for line in closeproc:
-        tcltarget.write(line)
+    tcltarget.write('}\n'
+                    '# |\n'
+                    '# +-----------------------------------\n\n')
 
 
 def HwTclUtility(tcltarget):
@@ -125,32 +145,318 @@ def HwTclUtility(tcltarget):
                    )
 
 
-def writeHwTcl(generics, connectionpoints, name, version, author, group):
-    ''' shortcut to generate the _hw.tcl file needed by Qsys '''
+def HwTclProtocol(tcltarget):
+    ''' the Tcl side of the request / response format, see fastpath.py '''
+    tcltarget.write('# +----------------------------------------------------------------\n'
+                    '# | request / response for the Python callbacks: a qgen/1 line and NAME=VALUE lines\n'
+                    'proc QgenRequest { names } {\n'
+                    '\tset request "qgen/1\\n"\n'
+                    '\tforeach name $names {\n'
+                    '\t\t# the Elaborate callback has read most parameters into p_NAME already\n'
+                    '\t\tupvar 1 p_$name hoisted\n'
+                    '\t\tif {[info exists hoisted]} {\n'
+                    '\t\t\tset value $hoisted\n'
+                    '\t\t} else {\n'
+                    '\t\t\tset value [get_parameter_value $name]\n'
+                    '\t\t}\n'
+                    '\t\tappend request "$name=[string map {\\\\ \\\\\\\\ \\n \\\\n} $value]\\n"\n'
+                    '\t}\n'
+                    '\treturn $request\n'
+                    '}\n\n'
+                    '# returns the response as a dictionary, anything written before the qgen/1 line is skipped\n'
+                    'proc QgenResponse { result } {\n'
+                    '\tset lines [split $result \\n]\n'
+                    '\tset start [lsearch -exact $lines qgen/1]\n'
+                    '\tif {$start < 0} {\n'
+                    '\t\terror "Expected a qgen/1 response, got <<$result>>"\n'
+                    '\t}\n'
+                    '\tset response [dict create]\n'
+                    '\tforeach line [lrange $lines [expr {$start + 1}] end] {\n'
+                    '\t\tset i [string first = $line]\n'
+                    '\t\tif {$i > 0} {\n'
+                    '\t\t\tdict set response [string range $line 0 [expr {$i - 1}]] \\\n'
+                    '\t\t\t\t[string map {\\\\n \\n \\\\\\\\ \\\\} [string range $line [expr {$i + 1}] end]]\n'
+                    '\t\t}\n'
+                    '\t}\n'
+                    '\treturn $response\n'
+                    '}\n\n'
+                    '# the value the elaborate function derived for name, or the current one if it did not\n'
+                    'proc QgenDerived { l name } {\n'
+                    '\tif {[dict exists $l $name]} {\n'
+                    '\t\treturn [dict get $l $name]\n'
+                    '\t}\n'
+                    '\tsend_message warning "Elaborate: no value derived for $name, keeping [get_parameter_value $name]"\n'
+                    '\treturn [get_parameter_value $name]\n'
+                    '}\n\n'
+                   )
+
+
+def HwTclTiming(tcltarget, name):
+    timing = ('# +----------------------------------------------------------------\n'
+              '# | report the time a Python call took, with what it tells about itself (@cache=hit ...)\n'
+              '# | and add a line to _this__timing.log\n'
+              'proc QgenTiming { callback start result } {\n'
+              '\tset record [format "%s %s %.1f ms" [clock format [clock seconds] -format "%Y-%m-%d %H:%M:%S"] \\\n'
+              '\t\t$callback [expr {([clock microseconds] - $start) / 1000.0}]]\n'
+              '\tset lines [split $result \\n]\n'
+              '\tset i [lsearch -exact $lines qgen/1]\n'
+              '\tif {$i >= 0} {\n'
+              '\t\tforeach line [lrange $lines [expr {$i + 1}] end] {\n'
+              '\t\t\tif {[string index $line 0] eq "@"} {\n'
+              '\t\t\t\tappend record " [string range $line 1 end]"\n'
+              '\t\t\t}\n'
+              '\t\t}\n'
+              '\t}\n'
+              '\tsend_message info $record\n'
+              '\tif {[catch {\n'
+              '\t\tset log [open [pwd]/_this__timing.log a]\n'
+              '\t\tputs $log $record\n'
+              '\t\tclose $log\n'
+              '\t}]} {\n'
+              '\t\tsend_message warning "Cannot write [pwd]/_this__timing.log"\n'
+              '\t}\n'
+              '}\n\n'
+             )
+    template.Template([timing], 'this').write(tcltarget, this=name)
+
+
+def tclquote(value):
+    ''' a value as a single Tcl word '''
+    text = fastpath.qsysvalue(value)
+    if text == '' or any(c in text for c in ' \t\n;"$[]{}\\'):
+        return '{{{}}}'.format(text)
+    return text
+
+
+def HwTclPython(python, pythonflags=None):
+    ''' the interpreter and its startup flags, as Tcl words '''
+    words = [tclquote(python)]
+    if pythonflags:
+        words.extend(pythonflags.split())
+    return ' '.join(words)
+
+
+def writeDepfile(name, directory=None, outputs=()):
+    ''' writes <name>_hw.tcl.d, in the Make format Ninja reads as well:
+        the _hw.tcl and the outputs depend on the component's sources, see cache.componentsources()
+        directory: where the _hw.tcl went, the current one if None
+        outputs: the other files the component's build writes, e.g. the converted HDL and the VCD file
+    '''
+    target = os.path.join(directory or '', '{}_hw.tcl'.format(name))
+    sources = cache.componentsources('{}.py'.format(name))
+    with open(target + '.d.tmp', 'w') as depfile:
+        depfile.write('{}:'.format(' '.join(path.replace(' ', '\\ ') for path in [target] + list(outputs))))
+        for source in sorted(set(sources)):
+            depfile.write(' \\\n  {}'.format(source.replace(' ', '\\ ')))
+        depfile.write('\n')
+    publish(target + '.d.tmp', target + '.d', keepunchanged=True)
+
+
+def precompile(name, elaborate=None):
+    ''' byte-compile the component (and the module holding the elaborate function)
+        so the Qsys callbacks don't have to
+    '''
+    sources = ['{}.py'.format(name)]
+    if isinstance(elaborate, str):
+        sources.append('{}.py'.format(elaborate.partition(':')[0].replace('.', os.sep)))
+    with compilelock:
+        for source in sources:
+            if os.path.exists(source):
+                py_compile.compile(source)
+
+
+def memosources(name, elaborate=None):
+    ''' the files the elaborate results depend upon, relative to the component's directory '''
+    sources = ['{}.py'.format(name)]
+    if isinstance(elaborate, str):
+        sources.append('{}.py'.format(elaborate.partition(':')[0].replace('.', '/')))
+    return sources
+
+
+def elaboratetable(generics, elaborate, limit):
+    ''' run the elaborate function over every combination of the allowed values
+        of the non-derived generics; those without a (finite) list contribute their default only
+        returns an ordered list of (key, result) or None if there would be more than limit entries
+    '''
+    inputs = [key for key, value in generics.genericlist.iteritems() if not value.derived]
+    choices = [generics.genericlist[key].allowedvalues() for key in inputs]
+    size = 1
+    for choice in choices:
+        size *= len(choice)
+    if size > limit:
+        print('Elaborate table would hold {} entries, more than {}: not embedded'.format(size, limit))
+        return None
+
+    function = fastpath.resolve(elaborate)
+    table = []
+    for combination in itertools.product(*choices):
+        key = [fastpath.qsysvalue(value) for value in combination]
+        try:
+            result = [fastpath.qsysvalue(item) for item in function(dict(zip(inputs, key)))]
+        except Exception:
+            # let the subprocess report it, when Qsys gets there
+            continue
+        table.append((key, result))
+    return table
+
+
+def HwTclElaborateTable(tcltarget, name, table):
+    tcltarget.write('# +----------------------------------------------------------------\n'
+                    '# | elaborate results, precomputed for the allowed parameter values\n'
+                    'set {}_elaboratetable {{\n'.format(name))
+    for key, result in table:
+        tcltarget.write('\t{{{}}} {{{}}}\n'.format(' '.join(tclquote(item) for item in key),
+                                                 ' '.join(tclquote(item) for item in result)))
+    tcltarget.write('}\n\n')
+
+
+def HwTclWorker(tcltarget, python='python'):
+    worker = ('# +----------------------------------------------------------------\n'
+              '# | persistent Python worker, see server.py\n'
+              '# | started on first use and restarted when the component\'s .py file changes\n'
+              'proc QgenWorker { script args } {\n'
+              '\tglobal qgen_worker qgen_worker_mtime\n'
+              '\tset mtime [file mtime $script]\n'
+              '\tif {[info exists qgen_worker] && [info exists qgen_worker_mtime($script)]} {\n'
+              '\t\tif {$qgen_worker_mtime($script) != $mtime} {\n'
+              '\t\t\tcatch {close $qgen_worker}\n'
+              '\t\t\tunset qgen_worker\n'
+              '\t\t}\n'
+              '\t}\n'
+              '\tif {![info exists qgen_worker]} {\n'
+              '\t\tset qgen_worker [open |[list _python_ -m Utilities.Qgen.server] r+]\n'
+              '\t\tfconfigure $qgen_worker -buffering line -translation lf\n'
+              '\t}\n'
+              '\tset qgen_worker_mtime($script) $mtime\n'
+              '\t# as with exec, \'<< value\' feeds value to stdin\n'
+              '\tset stdin [list]\n'
+              '\tset i [lsearch -exact $args <<]\n'
+              '\tif {$i >= 0} {\n'
+              '\t\tset stdin [split [string trimright [lindex $args [expr {$i + 1}]] \\n] \\n]\n'
+              '\t\tset args [lreplace $args $i [expr {$i + 1}]]\n'
+              '\t}\n'
+              '\tset request [linsert $args 0 [pwd] $script]\n'
+              '\tputs $qgen_worker "run [llength $request] [llength $stdin]"\n'
+              '\tforeach item [concat $request $stdin] {\n'
+              '\t\tputs $qgen_worker $item\n'
+              '\t}\n'
+              '\tif {[gets $qgen_worker header] < 0} {\n'
+              '\t\tcatch {close $qgen_worker}\n'
+              '\t\tunset qgen_worker\n'
+              '\t\terror "Qgen worker exited unexpectedly"\n'
+              '\t}\n'
+              '\tlassign $header status nout nerr\n'
+              '\tset out [list]\n'
+              '\tfor {set i 0} {$i < $nout} {incr i} {\n'
+              '\t\tgets $qgen_worker line\n'
+              '\t\tlappend out $line\n'
+              '\t}\n'
+              '\tset err [list]\n'
+              '\tfor {set i 0} {$i < $nerr} {incr i} {\n'
+              '\t\tgets $qgen_worker line\n'
+              '\t\tlappend err $line\n'
+              '\t}\n'
+              '\tif {$status ne "ok"} {\n'
+              '\t\terror [join [concat $out $err] \\n]\n'
+              '\t}\n'
+              '\tforeach line $err {\n'
+              '\t\tsend_message warning $line\n'
+              '\t}\n'
+              '\treturn [join $out \\n]\n'
+              '}\n\n'
+              )
+    template.Template([worker], 'python').write(tcltarget, python=python)
+
+
+def writeHwTcl(generics, connectionpoints, name, version, author, group, worker=False,
+               python='python', pythonflags=None, elaborate=None, elaborateflags=None,
+               elaboratetablesize=0, elaboratecache=None, memo=False, speculate=False,
+               timing=False, filesets=False, timestamp=True, depfile=False, depoutputs=(), directory=None):
+    ''' shortcut to generate the _hw.tcl file needed by Qsys
+        worker: run the callbacks in a persistent Python process instead of an 'exec python' per call
+        python: the interpreter to call upon, pythonflags: its startup flags, e.g. '-E -s'
+        elaborate: the elaborate function, if given as 'module:function' it is called through the fast path
+        elaborateflags: extra startup flags for that fast path, e.g. '-S' as it doesn't need site-packages
+        elaboratetablesize: if not 0, embed the elaborate results for (at most this many) combinations
+                            of the allowed parameter values, Qsys only calls upon Python for the others
+        elaboratecache: if not None, the fast path looks the result up in the persistent elaborate cache,
+                        holding at most this many entries
+        memo: remember the elaborate results in the Qsys session, a repeat elaboration
+              with the same parameter values doesn't call upon Python
+        speculate: Elaborate starts the conversion in the background, Generate picks up the result
+        timing: report the time each Python call takes and log it to <name>_timing.log
+        filesets: use the Qsys 13.1 file set callbacks instead of the sopc 11.0 Generate callback,
+                  the file sets of one language share a conversion and the language asked for is used
+        timestamp: stamp the time of writing in the header, without it an unchanged _hw.tcl is left alone
+        depfile: also write <name>_hw.tcl.d listing the Python sources it depends on, for Make or Ninja
+        depoutputs: the other files the build writes, targets in the depfile next to the _hw.tcl
+        directory: where to write the _hw.tcl (and the depfile), the current directory if None
+    '''
+    # rendered in memory, written next to it in one go, it only replaces the _hw.tcl if different
+    tcltarget = template.Buffer()
+    emitHwTcl(tcltarget, generics, connectionpoints, name, version, author, group, worker=worker,
+              python=python, pythonflags=pythonflags, elaborate=elaborate, elaborateflags=elaborateflags,
+              elaboratetablesize=elaboratetablesize, elaboratecache=elaboratecache, memo=memo,
+              speculate=speculate, timing=timing, filesets=filesets, timestamp=timestamp)
+    hwtcl = os.path.join(directory or '', '{}_hw.tcl'.format(name))
+    with open(hwtcl + '.tmp', 'w') as hwtclfile:
+        hwtclfile.write(tcltarget.getvalue())
+    publish(hwtcl + '.tmp', hwtcl, keepunchanged=True)
+    if depfile:
+        writeDepfile(name, directory, depoutputs)
+
+    precompile(name, elaborate if isinstance(elaborate, str) else None)
+
+
+def emitHwTcl(tcltarget, generics, connectionpoints, name, version, author, group, worker=False,
+              python='python', pythonflags=None, elaborate=None, elaborateflags=None,
+              elaboratetablesize=0, elaboratecache=None, memo=False, speculate=False,
+              timing=False, filesets=False, timestamp=True):
+    ''' writes the _hw.tcl to tcltarget: anything with a write(), a file, a pipe or a template.Buffer
+        the options as for writeHwTcl
+    '''
+
+    interpreter = HwTclPython(python, pythonflags)
+    if worker:
+        # the QgenWorker proc takes the place of 'exec python'
+        run = ['\tset command QgenWorker\n',
+               '\tlappend command [pwd]/_this_.py']
+    else:
+        run = ['\tset command exec\n',
+               # assume python is on the path and _this_.py is in the working
+               # directory
+               '\tlappend command {} [pwd]/_this_.py'.format(interpreter)]
+
+    if isinstance(elaborate, str) and not worker:
+        # run the elaborate function without importing the component (and MyHDL)
+        runelaborate = ['\tset command exec\n',
+                        '\tlappend command {} -m Utilities.Qgen.fastpath {}{}'
+                        .format(HwTclPython(python, ' '.join(filter(None, [pythonflags, elaborateflags]))),
+                                '' if elaboratecache is None else '--cache {} '.format(elaboratecache),
+                                elaborate)]
+    else:
+        runelaborate = run
 
     e1 = ['\tsend_message info "Current Directory: [pwd]"\n',
-          '\tset command exec\n',
-          # assume python is on the path and _this_.py is in the working
-          # directory
-          '\tlappend command python [pwd]/_this_.py --QsysElaborate \n',
+          runelaborate[0],
+          runelaborate[1] + ' --QsysElaborate -\n',
+          # the parameters go in on stdin, so there is no limit to their number
+          '\tlappend command << [QgenRequest {_generics_}]\n',
          ]
 
-    e3start = ['\tset result [eval $command]\n',
-               '\t# $result holds what was written to stdout\n',
-               '\t# it should look along the line like: lwidth_d 10 lwidth_q 8\n',
-               '\t# we don\'t care about \'()[],\' as we will strip them\n',
-               '\t#send_message info  "QsysElaborate: OK -> <<<* $result *>>>"\n',
-               '\t# now process the returns\n',
-               '\t# split the result\n',
-               '\tset r [string trim $result  "()[]" ]\n',
-               '\t#send_message info "<$r> [llength $r] [string is list $r]"\n',
-               '\tset l [list]\n',
-               '\tforeach item $r {\n',
-               '\t\tlappend l [string trim $item "\',"]\n',
-               '\t}\n',
-               '\t#send_message info "<<$l>>"\n',
-               '\tforeach {name val} $l {\n',
-               '\t\tsend_message info  "$name $val"\n',
+    if timing:
+        e2 = ['\tset start [clock microseconds]\n',
+              '\tset result [eval $command]\n',
+              '\tQgenTiming Elaborate $start $result\n']
+    else:
+        e2 = ['\tset result [eval $command]\n']
+    e3start = e2 + [
+               '\t# what was written to stdout: the qgen/1 line and NAME=VALUE lines\n',
+               '\tset l [QgenResponse $result]\n',
+               '\tdict for {name val} $l {\n',
+               '\t\tif {[string index $name 0] ne "@"} {\n',
+               '\t\t\tsend_message info "$name $val"\n',
+               '\t\t}\n',
                '\t}\n',
               ]
 #     e3proc = ['\t\tset_interface_property In dataBitsPerSymbol $In_d_width\n']
@@ -179,26 +485,68 @@ def writeHwTcl(generics, connectionpoints, name, version, author, group):
     g1 = ['\tsend_message info "Current Directory: [pwd]"\n',
           '\tset outdir [get_generation_property OUTPUT_DIRECTORY]\n',
           '\tset outputname [get_generation_property OUTPUT_NAME]\n',
-          '\tset targethdl [get_generation_property HDL_LANGUAGE]\n'
+          '\tset targethdl [get_generation_property HDL_LANGUAGE]\n',
           #         '\tset command exec >&@stdout\n',   # redirect the output but we need a console?
-          '\tset command exec\n',
-          # assume python is on the path and _this_.py is in the working
-          # directory
-          '\tlappend command python [pwd]/_this_.py -l $targethdl --QsysGenerate \n',
+          run[0],
+          run[1] + ' -l $targethdl --QsysGenerate \n',
           #             '\tlappend command python [pwd]/_this_.py -v --QsysGenerate \n', # assume python is on the path and _this_.py is in the working directory
-          '\tlappend command $outdir $outputname\n',
+          '\tlappend command $outdir $outputname -\n',
+          '\tlappend command << [QgenRequest {_generics_}]\n',
          ]
-    # this one has to be repeated for every generic
-    g2 = ['\tlappend command _generic_ [get_parameter_value _generic_ ] \n',  
+    # always a process of its own, detached, even with the worker
+    s1 = ['\t# start converting in the background, Generate picks up the result\n',
+          '\tset command exec\n',
+          '\tlappend command {} [pwd]/_this_.py --QsysSpeculate -\n'.format(interpreter),
+          '\tlappend command << [QgenRequest {_generics_}] &\n',
+          '\teval $command\n',
          ]
     g3 = ['\tsend_message info "Generating using command: $command"\n',
-          '\teval $command\n',
-          '\tadd_file $outdir/$outputname.vhd {SYNTHESIS SIMULATION}\n',
+          '\tset start [clock microseconds]\n' if timing else '',
+          '\tset result [eval $command]\n',
+          '\tQgenTiming Generate $start $result\n' if timing else '',
+          '\t# what the output depends on, e.g. the MyHDL package: the same files for every instance\n',
+          '\tset l [QgenResponse $result]\n',
+          '\tif {[dict exists $l @files]} {\n',
+          '\t\tforeach file [dict get $l @files] {\n',
+          '\t\t\tadd_file $outdir/$file {SYNTHESIS SIMULATION}\n',
+          '\t\t}\n',
+          '\t}\n',
+          '\tset extension [expr {[string equal -nocase $targethdl VERILOG] ? "v" : "vhd"}]\n',
+          '\tadd_file $outdir/$outputname.$extension {SYNTHESIS SIMULATION}\n',
+         ]
+    # converts once per instance and language, every file set asking for that language gets the same file
+    f1 = ['\tglobal _this__filesets\n',
+          '\tset request [QgenRequest {_generics_}]\n',
+          '\tset key [list $entityname $language $request]\n',
+          '\tset extension [expr {$language eq "VERILOG" ? "v" : "vhd"}]\n',
+          '\tif {![info exists _this__filesets($key)] || ![file exists [lindex $_this__filesets($key) end]]} {\n',
+          '\t\tset outdir [file dirname [create_temp_file $entityname.$extension]]\n',
+          '\t' + run[0],
+          '\t' + run[1] + ' -l $language --sharedfiles --QsysGenerate $outdir $entityname -\n',
+          '\t\tlappend command << $request\n',
+          '\t\tsend_message info "Generating using command: $command"\n',
+          '\t\tset start [clock microseconds]\n' if timing else '',
+          '\t\tset result [eval $command]\n',
+          '\t\tQgenTiming Generate $start $result\n' if timing else '',
+          '\t\t# what the output depends on first, e.g. the MyHDL package: the same files for every instance,\n',
+          '\t\t# from one directory outside the temporary ones (an absolute path)\n',
+          '\t\tset l [QgenResponse $result]\n',
+          '\t\tset _this__filesets($key) [list]\n',
+          '\t\tif {[dict exists $l @files]} {\n',
+          '\t\t\tforeach file [dict get $l @files] {\n',
+          '\t\t\t\tlappend _this__filesets($key) [file join $outdir $file]\n',
+          '\t\t\t}\n',
+          '\t\t}\n',
+          '\t\tlappend _this__filesets($key) $outdir/$entityname.$extension\n',
+          '\t}\n',
+          '\tforeach path $_this__filesets($key) {\n',
+          '\t\tadd_fileset_file [file tail $path] $language PATH $path\n',
+          '\t}\n',
          ]
 
-    tcltarget = open('%s_hw.tcl' % (name), 'w')
     doelaborate = True if (len(generics.genericlist) > 0) else False
-    HwTclHeader(tcltarget, name, version, author, group, elaborate=doelaborate)
+    HwTclHeader(tcltarget, name, version, author, group, elaborate=doelaborate, filesets=filesets,
+                timestamp=timestamp)
     if not generics is None:
         for key, values in generics.genericlist.iteritems():
             values.tclparameter(tcltarget)
@@ -210,77 +558,321 @@ def writeHwTcl(generics, connectionpoints, name, version, author, group):
             values.tclconnectionpoint(tcltarget)
 
     if generics is not None and len(generics.genericlist) > 0:
-        HwTclopenproc(tcltarget, 'Elaborate')
         # if any derived parameters we must ask Python code to elaborate
         derivedparams = False
-        for _, value in generics.genericlist.iteritems():
-            if hasattr(value, 'derived') and value.derived:
+        for key in generics.genericlist:
+            if generics.isderived(key):
                 derivedparams = True
                 break
 
+        table = None
+        if derivedparams and elaboratetablesize and elaborate is not None:
+            table = elaboratetable(generics, elaborate, elaboratetablesize)
+            if table is not None:
+                HwTclElaborateTable(tcltarget, name, table)
+
+        HwTclopenproc(tcltarget, 'Elaborate')
+        # every parameter is read once, however many connection points use it
+        generics.tclreadparameters(tcltarget)
         if derivedparams:
             # collect all Parameters
-            for line in e1:
-                line = string.replace(line, '_this_', name)
-                tcltarget.write(line)
-            for key, value in generics.genericlist.iteritems():
-#                 if hasattr(value, 'derived') and not value.derived:
-                if not value.derived:
-                    for line in g2:
-                        line = string.replace(line, '_generic_', key)
-                        tcltarget.write(line)
-            for line in e3start:
-                tcltarget.write(line)
-
+            inputs = ' '.join(key for key, value in generics.genericlist.iteritems() if not value.derived)
+            request = template.Template(e1, 'this', 'generics').render(this=name, generics=inputs).splitlines(True)
+            request.extend(e3start)
+
+            lookups = []
+            if table is not None:
+                # only call upon Python for what is not in the table
+                tcltarget.write('\tglobal {}_elaboratetable\n'.format(name))
+                lookups.append(('[dict exists ${0}_elaboratetable $key]'.format(name),
+                                'set l [dict get ${0}_elaboratetable $key]'.format(name)))
+            if memo:
+                # the memo is dropped when the component (or the elaborate module) changes
+                tcltarget.write('\tglobal {0}_elaboratememo\n'
+                                '\tset sources [list'.format(name))
+                for source in memosources(name, elaborate):
+                    tcltarget.write(' [expr {{[file exists [pwd]/{0}] ? [file mtime [pwd]/{0}] : 0}}]'
+                                    .format(source))
+                tcltarget.write(']\n'
+                                '\tif {{![info exists {0}_elaboratememo(@sources)]'
+                                ' || ${0}_elaboratememo(@sources) ne $sources}} {{\n'
+                                '\t\tarray unset {0}_elaboratememo\n'
+                                '\t\tset {0}_elaboratememo(@sources) $sources\n'
+                                '\t}}\n'.format(name))
+                lookups.append(('[info exists {0}_elaboratememo($key)]'.format(name),
+                                'set l ${0}_elaboratememo($key)'.format(name)))
+
+            if lookups:
+                tcltarget.write('\tset key [list')
+                for key, value in generics.genericlist.iteritems():
+                    if not value.derived:
+                        tcltarget.write(' {}'.format(generics.tclvalue(key)))
+                tcltarget.write(']\n')
+                # 'else' followed by the next 'if' makes an 'elseif'
+                tcltarget.write('\t')
+                for condition, body in lookups:
+                    tcltarget.write('if {{{}}} {{\n'
+                                    '\t\t{}\n'
+                                    '\t}} else'.format(condition, body))
+                tcltarget.write(' {\n')
+                for line in request:
+                    tcltarget.write('\t' + line)
+                if memo:
+                    tcltarget.write('\t\tset {}_elaboratememo($key) $l\n'.format(name))
+                tcltarget.write('\t}\n')
+            else:
+                for line in request:
+                    tcltarget.write(line)
+
+        # the derived parameters with an expression are computed right here
+        for key, value in generics.genericlist.iteritems():
+            if value.expression is not None:
+                tcltarget.write('\tset p_{0} [expr {{{1}}}]\n'
+                                '\tset_parameter_value {0} $p_{0}\n'.format(key, value.expression.tcl(generics.tclvalue)))
+                if value.expression.checktree is not None:
+                    tcltarget.write('\tif {{!{}}} {{\n'
+                                    '\t\tsend_message error "{}: check \'{}\' fails"\n'
+                                    '\t}}\n'.format(value.expression.tclcheck(generics.tclvalue), key,
+                                                    value.expression.checktext))
+
+        # the derived generics the connection points set themselves, collected per call
+        # as the same generics may be written out again, maybe from another thread
+        derived = set()
         if connectionpoints is not None:
             for key, values in connectionpoints.connectionpointslist.iteritems():
-                values.elaborate(tcltarget)
+                values.elaborate(tcltarget, derived)
 
         # handle the 'orphaned' derived generics
         tcltarget.write('\n')
         for key, value in generics.genericlist.iteritems():
-            if value.derived and not value.markderived:
-                tcltarget.write('\tset_parameter_value {0} [ lindex $l [expr [lsearch $l "{0}"] +1]]] \n'.format( key))
+            if generics.isderived(key) and key not in derived:
+                tcltarget.write('\tset_parameter_value {} {}\n'.format(key, generics.tclderived(key)))
 
-        HwTclcloseproc(tcltarget)
+        if speculate:
+            template.Template(s1, 'this', 'generics').write(tcltarget, this=name,
+                                                             generics=' '.join(generics.parameters()))
 
-    HwTclopenproc(tcltarget, 'Generate')
-    if not generics is None:
-        for line in g1:
-            line = string.replace(line, '_this_', name)
-            tcltarget.write(line)
+        HwTclcloseproc(tcltarget)
 
-        for key, value in generics.genericlist.iteritems():
-            #             if hasattr(value, 'derived') and not value.derived:
-            for line in g2:
-                line = string.replace(line, '_generic_', key)
-                tcltarget.write(line)
-
-        for line in g3:
-            tcltarget.write(line)
-    HwTclcloseproc(tcltarget)
+    if filesets:
+        HwTclopenproc(tcltarget, 'QgenFileset', 'entityname language')
+        template.Template(f1, 'this', 'generics').write(tcltarget, this=name,
+                                                         generics=' '.join(generics.parameters()))
+        HwTclcloseproc(tcltarget)
+        for proc, language in (('GenerateSynthesis', 'VHDL'), ('GenerateSimVHDL', 'VHDL'),
+                               ('GenerateSimVerilog', 'VERILOG')):
+            HwTclopenproc(tcltarget, proc, 'entityname')
+            tcltarget.write('\tQgenFileset $entityname {}\n'.format(language))
+            HwTclcloseproc(tcltarget)
+    else:
+        HwTclopenproc(tcltarget, 'Generate')
+        if not generics is None:
+            template.Template(g1, 'this', 'generics').write(tcltarget, this=name,
+                                                             generics=' '.join(generics.parameters()))
+            tcltarget.write(''.join(g3))
+        HwTclcloseproc(tcltarget)
     HwTclUtility(tcltarget)
-    tcltarget.close()
+    HwTclProtocol(tcltarget)
+    if timing:
+        HwTclTiming(tcltarget, name)
+    if worker:
+        HwTclWorker(tcltarget, interpreter)
+
+
+def renameEntity(source, destination, target, name):
+    ''' copies source to destination, line by line, renaming the VHDL entity and architecture
+        or the Verilog module target to name
+    '''
+    identifier = re.compile(r'\b{}\b'.format(re.escape(target)))
+    with open(source, 'r') as hdlsource:
+        with open(destination, 'w') as hdldestination:
+            for line in hdlsource:
+                if 'entity' in line or ('architecture' in line and 'of' in line) or line.lstrip().startswith('module') \
+                        or 'File:' in line:
+                    line = identifier.sub(name, line)
+                hdldestination.write(line)
+
+
+def publish(filename, destination, keepunchanged=False):
+    ''' moves filename to destination in one go: a reader sees either the old file or the new one
+        keepunchanged: leave destination (and its timestamp) alone if it has the same contents
+    '''
+    if keepunchanged and os.path.exists(destination) and filecmp.cmp(filename, destination, shallow=False):
+        os.remove(filename)
+        return
+    try:
+        os.rename(filename, destination)
+    except OSError:
+        # Windows doesn't rename over an existing file
+        os.remove(destination)
+        os.rename(filename, destination)
+
+
+# the label of the shared entity's instance in a wrapper, not a VHDL (or Verilog) reserved word
+WRAPPERLABEL = 'u_shared'
+
+
+def writeWrapper(source, destination, shared, name):
+    ''' writes an entity (or module) name with the same ports as shared in source,
+        and that only instantiates shared
+    '''
+    with open(source, 'r') as hdlsource:
+        lines = hdlsource.readlines()
+    with open(destination, 'w') as target:
+        if destination.endswith('.v'):
+            header = [i for i, line in enumerate(lines) if re.match(r'\s*module\s+{}\b'.format(shared), line)][0]
+            end = [i for i, line in enumerate(lines) if i > header and line.strip() == ');'][0]
+            declarations = [line for line in lines[end:] if re.match(r'\s*(input|output|inout)\b', line)]
+            ports = [re.match(r'[^;]*?(\w+)\s*;', line).group(1) for line in declarations]
+            target.writelines(line for line in lines[:header] if line.startswith('`timescale'))
+            target.write('\nmodule {} (\n'.format(name))
+            target.writelines(lines[header + 1:end + 1])
+            target.writelines(declarations)
+            target.write('\n{} {} (\n'.format(shared, WRAPPERLABEL))
+            target.write(',\n'.join('    .{0}({0})'.format(port) for port in ports))
+            target.write('\n);\n\nendmodule\n')
+        else:
+            header = [i for i, line in enumerate(lines) if re.match(r'\s*entity\s+{}\s+is'.format(shared), line)][0]
+            end = [i for i, line in enumerate(lines) if re.match(r'\s*end\s+entity\s+{}\b'.format(shared), line)][0]
+            ports = [match.group(1) for match in (re.match(r'\s*(\w+)\s*:\s*(in|out|inout|buffer)\b', line, re.I)
+                                                  for line in lines[header + 1:end]) if match]
+            target.writelines(line for line in lines[:header] if re.match(r'(library|use)\b', line, re.I))
+            target.write('\nentity {} is\n'.format(name))
+            target.writelines(lines[header + 1:end])
+            target.write('end entity {};\n\n'.format(name))
+            target.write('architecture MyHDL of {} is\nbegin\n\n'.format(name))
+            target.write('    {}: entity work.{}\n        port map (\n'.format(WRAPPERLABEL, shared))
+            target.write(',\n'.join('            {0} => {0}'.format(port) for port in ports))
+            target.write('\n        );\n\nend architecture MyHDL;\n')
+
+
+def myhdlpackage():
+    ''' MyHDL's VHDL support package as (file name, text),
+        None if this MyHDL doesn't have the (private) names we read it from
+    '''
+    try:
+        # MyHDL only writes it along with a conversion, there is no public interface to it
+        from myhdl.conversion._toVHDLPackage import _package, _shortversion
+    except (ImportError, AttributeError):
+        return None
+    return 'pck_myhdl_{}.vhd'.format(_shortversion), _package
+
+
+def writeMyHDLPackage(directory, converted=None):
+    ''' writes MyHDL's VHDL support package into directory, unless it is there already
+        so all instances converted into that directory use one and the same file
+        if myhdlpackage() can't get at it, the converter wrote it: takes it from
+        the directory converted into, or else the one an earlier conversion left in directory
+        returns the file name, None if there is none (yet)
+    '''
+    import myhdl
+    package = myhdlpackage()
+    if package is None:
+        if converted is not None:
+            for source in glob.glob(os.path.join(converted, 'pck_myhdl_*.vhd')):
+                filename = os.path.basename(source)
+                path = os.path.join(directory, filename)
+                if not os.path.exists(path):
+                    # the converted directory may be elsewhere, publish from next to path
+                    temporary = '{}.{}.tmp'.format(path, os.getpid())
+                    shutil.copyfile(source, temporary)
+                    publish(temporary, path)
+                return filename
+        found = sorted(glob.glob(os.path.join(directory, 'pck_myhdl_*.vhd')))
+        return os.path.basename(found[-1]) if found else None
+    filename, text = package
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'w') as target:
+            target.write('-- File: {}\n-- Generated by MyHDL {}\n\n'.format(filename, myhdl.__version__))
+            target.write(text + '\n')
+        publish(temporary, path)
+    return filename
 
 
 def updateEntity(target, name):
-    vhdsource = open('{}.vhd' .format(target), 'r')
-    source = vhdsource.readlines()
-    vhdsource.close()
-    destination = []
-    for line in source:
-        if 'entity' in line:
-            line = string.replace(line, target, name)
-        elif 'architecture' in line and 'of' in line:
-            line = string.replace(line, target, name)
-        destination.append(line)
-
-    vhddestination = open('{}.vhd' .format(target), 'w')
-    vhddestination.writelines(destination)
-    vhddestination.close()
+    ''' renames the entity in target.vhd, in place '''
+    renameEntity('{}.vhd'.format(target), '{}.vhd.tmp'.format(target), target, name)
+    publish('{}.vhd.tmp'.format(target), '{}.vhd'.format(target))
 
 
 if __name__ == '__main__':
     #''' here we add some tests '''
-
-    sys.exit(0)
+    import tempfile
+    import shutil
+
+    # the VHDL-2008 reserved words
+    VHDLKEYWORDS = set('''abs access after alias all and architecture array assert assume assume_guarantee
+        attribute begin block body buffer bus case component configuration constant context cover default
+        disconnect downto else elsif end entity exit fairness file for force function generate generic group
+        guarded if impure in inertial inout is label library linkage literal loop map mod nand new next nor not
+        null of on open or others out package parameter port postponed procedure process property protected pure
+        range record register reject release rem report restrict restrict_guarantee return rol ror select
+        sequence severity shared signal sla sll sra srl strong subtype then to transport type unaffected units
+        until use variable vmode vprop vunit wait when while with xnor xor'''.split())
+    directory = tempfile.mkdtemp(prefix='qgen_wrapper.')
+    try:
+        shared, wrapper = os.path.join(directory, 'shared.vhd'), os.path.join(directory, 'wrapper.vhd')
+        with open(shared, 'w') as target:
+            target.write('library IEEE;\nuse IEEE.std_logic_1164.all;\n\nentity comp_1234 is\n    port (\n'
+                         '        Clk: in std_logic;\n        Q: out std_logic\n    );\nend entity comp_1234;\n')
+        writeWrapper(shared, wrapper, 'comp_1234', 'inst_0')
+        with open(wrapper, 'r') as source:
+            text = source.read()
+        labels = re.findall(r'^\s*(\w+)\s*:\s*entity\b', text, re.M)
+        ok = bool(labels) and not VHDLKEYWORDS.intersection(label.lower() for label in labels)
+        print(text)
+        print('instance label(s) {}: {}'.format(labels, 'ok' if ok else 'a reserved word'))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    # a component with a section: the Elaborate callback must not ask for it, nor set it,
+    # and a derived value missing from the response keeps the current one
+    try:
+        import Tkinter as tkinter
+        from StringIO import StringIO
+    except ImportError:
+        import tkinter
+        from io import StringIO
+    import Utilities.Qgen.generics as generics
+    import Utilities.Qgen.qerror as qerror
+
+    parameters = generics.Generics()
+    parameters.addsection('Data')
+    parameters.addgeneric('WIDTH', ('Natural', 8, '1:64'))
+    parameters.addgeneric('WIDTH_D', ('Natural', 8), True)
+    parameters.addgeneric('HALF', ('Natural', 4), 'WIDTH / 2')
+    try:
+        parameters.addgeneric('BAD', ('Natural', 0), 'Data + 1')
+        print('an expression using a section: accepted')
+        ok = False
+    except qerror.QError as e:
+        print('an expression using a section: {}'.format(e))
+    hwtcl = StringIO()
+    emitHwTcl(hwtcl, parameters, None, 'comp', '1.0', 'me', 'test', filesets=True, timestamp=False)
+    tcl = tkinter.Tcl()
+    # the Qsys commands do nothing, apart from these; the elaborate function returns WIDTH only
+    tcl.eval('proc unknown args {}\n'
+             'proc package args {}\n'
+             'proc get_parameter_value { name } { return $::param($name) }\n'
+             'proc set_parameter_value { name value } { lappend ::set $name $value }\n'
+             'proc send_message { level message } { lappend ::messages "$level: $message" }\n'
+             'rename exec {}\n'
+             'proc exec args { set ::request [lindex $args end]; return "qgen/1\\nWIDTH=8\\n" }\n'
+             'array set param {WIDTH 16 WIDTH_D 8 HALF 4}\n'
+             'set set [list]\n'
+             'set messages [list]\n')
+    tcl.eval(hwtcl.getvalue())
+    try:
+        tcl.eval('Elaborate')
+        result = 'ok'
+    except tkinter.TclError as e:
+        result = 'error: {}'.format(e)
+    settings, request = tcl.eval('set set'), tcl.eval('set request')
+    print('Elaborate with a section: {}, set {}, request {}'.format(result, settings, ' '.join(request.split())))
+    for message in tcl.eval('join $messages \\n').splitlines():
+        print('    {}'.format(message))
+    ok = ok and result == 'ok' and settings.split() == ['HALF', '8', 'WIDTH_D', '8'] \
+        and 'Data' not in request.split()
+    sys.exit(0 if ok else 1)
@@ -29,11 +29,41 @@ splitting a large source file into more manageable pieces
 
 from __future__ import print_function
 
-import string
 import collections
 
 import Utilities.Qgen.qerror as qerror
-
+import Utilities.Qgen.expression as expression
+import Utilities.Qgen.template as template
+
+
+PARAMETER = ['add_parameter _param_ _type_ _value_\n',
+             'set_parameter_property _param_ DEFAULT_VALUE _value_\n',
+             'set_parameter_property _param_ ALLOWED_RANGES _allowedranges_\n',
+             'set_parameter_property _param_ DISPLAY_HINT boolean\n',
+             'set_parameter_property _param_ DISPLAY_NAME _displayname_\n',
+             'set_parameter_property _param_ TYPE _type_\n',
+             'set_parameter_property _param_ UNITS _units_\n',
+             'set_parameter_property _param_ AFFECTS_ELABORATION true\n',
+             'set_parameter_property _param_ AFFECTS_GENERATION true\n',
+             'set_parameter_property _param_ HDL_PARAMETER false\n',
+             'set_parameter_property _param_ DERIVED true\n',
+             '\n'
+            ]
+
+# compiled on first use, one for every combination of the lines that may be left out
+parametertemplates = {}
+
+
+def parametertemplate(allowedranges, boolean, derived):
+    key = (allowedranges, boolean, derived)
+    if key not in parametertemplates:
+        lines = [line for line in PARAMETER
+                 if (allowedranges or 'ALLOWED_RANGES' not in line)
+                 and (boolean or 'DISPLAY_HINT' not in line)
+                 and (derived or 'DERIVED' not in line)]
+        parametertemplates[key] = template.Template(lines, 'param', 'type', 'value', 'units',
+                                                    'allowedranges', 'displayname')
+    return parametertemplates[key]
 
 
 class Generics(object):
@@ -51,8 +81,30 @@ class Generics(object):
         self.genericlist.update({sectionname: value})
 
     def addgeneric(self, key, decl, derived=False):
+        ''' derived: True if the elaborate function computes the value,
+                     or an expression (with an optional check): 'A / B' or ('A / B', 'A % B == 0')
+        '''
         if key in self.genericlist:
             raise qerror.QError("Generic / Parameter {} already in dictionary" .format(key))
+        derivedexpression = None
+        if isinstance(derived, (str, tuple)):
+            if isinstance(derived, tuple):
+                derivedexpression = expression.Expression(*derived)
+            else:
+                derivedexpression = expression.Expression(derived)
+            for name in derivedexpression.names:
+                if name == key:
+                    # the check may well look at the outcome
+                    continue
+                if name not in self.genericlist:
+                    raise qerror.QError("{}: unknown Generic / Parameter {} in expression".format(key, name))
+                if isinstance(self.genericlist[name], Section):
+                    raise qerror.QError("{}: expression uses {} which is a section".format(key, name))
+                if self.isderived(name):
+                    raise qerror.QError("{}: expression uses {} which is derived by the elaborate function"
+                                        .format(key, name))
+            derived = True
+
         if decl[0] == 'Natural':
             value = GenericNatural(key, decl, derived)
         elif decl[0] == 'Boolean':
@@ -62,6 +114,7 @@ class Generics(object):
         else:
             raise qerror.QError('Unhandled Generic \'{}\''.format(decl))
 
+        value.expression = derivedexpression
         self.genericlist.update({key: value})
 
     def value(self, key):
@@ -77,11 +130,75 @@ class Generics(object):
             return None
 
     def isderived(self, key):
-        return self.genericlist[key].derived
+        ''' derived by the elaborate function
+            the expression-derived generics are set up front in the Elaborate callback
+            and read as any other parameter
+        '''
+        generic = self.genericlist[key]
+        return generic.derived and generic.expression is None and not isinstance(generic, Section)
+
+    def parameters(self):
+        ''' the names Qsys knows as parameters: all but the sections '''
+        return [key for key, generic in self.genericlist.iteritems() if not isinstance(generic, Section)]
+
+    def expressionchain(self, key):
+        ''' returns the generics the expression of key depends upon:
+            the plain ones, and the expression-derived ones in the order they are evaluated
+        '''
+        inputs = []
+        chain = []
+
+        def visit(name):
+            generic = self.genericlist[name]
+            if generic.expression is None:
+                if name not in inputs:
+                    inputs.append(name)
+            elif name not in chain:
+                for item in generic.expression.names:
+                    if item != name:
+                        visit(item)
+                chain.append(name)
+
+        visit(key)
+        return inputs, chain
+
+    def evaluatederived(self):
+        ''' compute the expression-derived generics from the current values of the others '''
+        values = {}
+        for key, generic in self.genericlist.iteritems():
+            if generic.expression is not None:
+                generic.genericvalue = generic.expression.evaluate(values)
+            values[key] = generic.value()
+            if generic.expression is not None and not generic.expression.check(values):
+                raise qerror.QError("{}: check '{}' fails for {}"
+                                    .format(key, generic.expression.checktext, values))
+
+    def hoisted(self, key):
+        ''' the Elaborate callback reads the parameter once, into p_<key>: all but those the elaborate function derives '''
+        generic = self.genericlist.get(key) if isinstance(key, str) else None
+        return generic is not None and (not generic.derived or generic.expression is not None)
+
+    def tclreadparameters(self, tcltarget):
+        ''' at the top of the Elaborate callback, read every parameter it uses once into p_<key>
+            the expression-derived ones get theirs when they are computed
+        '''
+        for key, generic in self.genericlist.iteritems():
+            if not generic.derived:
+                tcltarget.write('\tset p_{0} [get_parameter_value {0}]\n'.format(key))
+
+    def tclvalue(self, key):
+        ''' the Tcl code reading the value of key in the Elaborate callback '''
+        if self.hoisted(key):
+            return '$p_{}'.format(key)
+        return '[get_parameter_value {}]'.format(key)
+
+    def tclderived(self, key):
+        ''' the Tcl code retrieving the value the elaborate function derived for key
+            from the response dictionary $l in the Elaborate callback,
+            keeping the current value if the response lacks it
+        '''
+        return '[QgenDerived $l {}]'.format(key)
 
-    def markderived(self, key):
-        self.genericlist[key].markderived = True
-        
     def show(self):
         print('Generics / Parameters')
         for generic in self.genericlist.values():
@@ -101,7 +218,7 @@ class Generic(object):
         self.allowedranges = None
         self.units = None
         self.derived = False
-        self.markderived = False
+        self.expression = None
 
     def show(self):
         print('{:{width}}Generic: {} : {} := {} -- allowed range: {}, description: {}' \
@@ -111,71 +228,35 @@ class Generic(object):
     def value(self):
         return self.genericvalue
 
+    def allowedvalues(self, limit=None):
+        ''' the values this generic can take, as far as we can tell '''
+        return [self.value()]
+
     def tclparameter(self, tcltarget):
-        for line in ['add_parameter _param_ _type_ _value_\n',
-                     'set_parameter_property _param_ DEFAULT_VALUE _value_\n',
-                     'set_parameter_property _param_ ALLOWED_RANGES _allowedranges_\n',
-                     'set_parameter_property _param_ DISPLAY_HINT boolean\n',
-                     'set_parameter_property _param_ DISPLAY_NAME _displayname_\n',
-                     'set_parameter_property _param_ TYPE _type_\n',
-                     'set_parameter_property _param_ UNITS _units_\n',
-                     'set_parameter_property _param_ AFFECTS_ELABORATION true\n',
-                     'set_parameter_property _param_ AFFECTS_GENERATION true\n',
-                     'set_parameter_property _param_ HDL_PARAMETER false\n',
-                     'set_parameter_property _param_ DERIVED true\n',
-                     '\n'
-                    ]:
-            keepline = True
-            line = string.replace(line, '_param_', self.name)
-            line = string.replace(line, '_type_', self.vhdltype)
-            line = string.replace(line, '_value_', '{}'.format(self.genericvalue))
-            line = string.replace(line, '_units_', '{}'.format(self.units))
-            if self.allowedranges is not None:
-                if self.vhdltype == 'natural' or self.vhdltype == 'integer':
-                    if isinstance(self.allowedranges, str):
-                        ar = self.allowedranges
-                    else:
-                        ar = ' '
-                        for item in self.allowedranges:
-                            ar += str(item) + ' '
-                            
-                    line = string.replace(line, '_allowedranges_', '{{{}}}'.format(ar))
-                    
-                elif self.vhdltype == 'string':
-                    # make the altera required representsation { "if with space"  no_space_in_string ... }
-                    line = string.replace(line, '_allowedranges_', '{{ {} }}'.format(self.allowedranges))
-                    
-                elif self.vhdltype == 'boolean':
-                    pass
-                
-                elif self.vhdltype == 'std_logic_vector':
-                    pass
-                
-                elif self.vhdltype == 'std_logic':
-                    pass
-                
-            else:
-                # must delete this line ...
-                if '_allowedranges_' in line:
-                    keepline = False
-                    
-            if self.description is not None:
-                line = string.replace(line, '_displayname_', '{}'.format(self.description))
-            else:
-                line = string.replace(line, '_displayname_', self.name)
+        allowedranges = None
+        if self.allowedranges is not None:
+            if self.vhdltype == 'natural' or self.vhdltype == 'integer':
+                if isinstance(self.allowedranges, str):
+                    ar = self.allowedranges
+                else:
+                    ar = ' '
+                    for item in self.allowedranges:
+                        ar += str(item) + ' '
+                allowedranges = '{{{}}}'.format(ar)
 
-            if 'DERIVED' in line:
-                keepline = self.derived
+            elif self.vhdltype == 'string':
+                # make the altera required representsation { "if with space"  no_space_in_string ... }
+                allowedranges = '{{ {} }}'.format(self.allowedranges)
 
-            if self.vhdltype != 'boolean':
-                if 'boolean' in line:
-                    keepline = False
+            else:
+                # boolean, std_logic_vector, std_logic, ...: left as they were
+                allowedranges = '_allowedranges_'
 
-            if keepline:
-                tcltarget.write(line)
+        parametertemplate(allowedranges is not None, self.vhdltype == 'boolean', bool(self.derived)).write(
+            tcltarget, param=self.name, type=self.vhdltype, value=self.genericvalue, units=self.units,
+            allowedranges=allowedranges,
+            displayname=self.description if self.description is not None else self.name)
 
-            # add a blank line in between
-            tcltarget.write('')
 
 class Section(Generic):
     def __init__(self, sectionname):
@@ -207,6 +288,23 @@ class GenericNatural(Generic):
     def update(self, argqys):
         self.genericvalue = int(argqys)
 
+    def allowedvalues(self, limit=None):
+        ''' a list, or a 'low : high' range, which we sample if longer than limit '''
+        if isinstance(self.allowedranges, str):
+            try:
+                low, high = [int(bound) for bound in self.allowedranges.split(':')]
+            except ValueError:
+                return [self.value()]
+            count = high - low + 1
+            if limit and count > limit:
+                return sorted(set([low + (count - 1) * i // (limit - 1) for i in range(limit)]))
+            return list(range(low, high + 1))
+
+        if self.allowedranges is not None:
+            return list(self.allowedranges)
+
+        return [self.value()]
+
 
 class GenericString(Generic):
     def __init__(self, name, decl, derived=False):
@@ -224,6 +322,11 @@ class GenericString(Generic):
     def update(self, argqys):
         self.genericvalue = argqys
 
+    def allowedvalues(self, limit=None):
+        if isinstance(self.allowedranges, (tuple, list)):
+            return list(self.allowedranges)
+        return [self.value()]
+
 
 class GenericStringList(Generic):
     def __init__(self, name, decl, derived=False):
@@ -261,6 +364,9 @@ class GenericBoolean(Generic):
     def value(self):
         return self.genericvalue == 'true' or self.genericvalue == True
 
+    def allowedvalues(self, limit=None):
+        return [False, True]
+
 
 if __name__ == '__main__':
     #''' here we add some tests '''
@@ -0,0 +1,105 @@
+#  This file is part of the Qgen utility, a Python package for
+#  extending the MyHDL package
+#
+#  Copyright (C) 2014-2015 Josy Boelen
+#
+#  The Qgen utility is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public License as
+#  published by the Free Software Foundation; either version 3.0 of the
+#  License, or (at your option) any later version.
+#
+#  This utility is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+'''
+a benchmark for the _hw.tcl emitters: a synthetic component with thousands of generics
+and hundreds of connection points, rendered into memory
+
+    python -m Utilities.Qgen.hwtclbench [-g generics] [-c connectionpoints] [-r repeat]
+'''
+
+from __future__ import print_function
+
+import time
+import argparse
+
+import Utilities.Qgen.generics as generics
+import Utilities.Qgen.connectionpoints as connectionpoints
+import Utilities.Qgen.generate as generate
+import Utilities.Qgen.template as template
+
+
+def component(ngenerics=4000, nconnectionpoints=400):
+    ''' the generics and connection points: clocks, resets, sinks and sources in turn,
+        every fourth generic derived, half of them with allowed ranges
+    '''
+    genericlist = []
+    for i in range(ngenerics):
+        if i % 2:
+            decl = ('Natural', 8, (1, 2, 4, 8), None, 'width {}'.format(i))
+        else:
+            decl = ('Natural', 8)
+        genericlist.append(('W{}'.format(i), decl, i % 4 == 0))
+    decls = []
+    for i in range(nconnectionpoints):
+        clock, reset = 'Clk{}'.format(i // 4), 'Reset{}'.format(i // 4)
+        width = 'W{}'.format(i % ngenerics)
+        if i % 4 == 0:
+            decls.append(('Clock', (clock, 0)))
+        elif i % 4 == 1:
+            decls.append(('Reset', (reset, clock, 'DEASSERT')))
+        elif i % 4 == 2:
+            decls.append(('Sink', ('In{}'.format(i), (clock, reset), ('D{}'.format(i), width), (True,))))
+        else:
+            decls.append(('Source', ('Out{}'.format(i), (clock, reset), ('Q{}'.format(i), width), (True,))))
+    qgenerics = generics.Generics(genericlist)
+    return qgenerics, connectionpoints.ConnectionPoints(qgenerics, decls)
+
+
+def timed(function, repeat):
+    ''' the best of repeat runs, in seconds, and what the last one rendered '''
+    best = None
+    for _ in range(repeat):
+        target = template.Buffer()
+        start = time.time()
+        function(target)
+        duration = time.time() - start
+        best = duration if best is None else min(best, duration)
+    return best, target.getvalue()
+
+
+def benchmark(ngenerics=4000, nconnectionpoints=400, repeat=5):
+    qgenerics, qconnectionpoints = component(ngenerics, nconnectionpoints)
+
+    def parameters(target):
+        for generic in qgenerics.genericlist.values():
+            generic.tclparameter(target)
+
+    def interfaces(target):
+        for connectionpoint in qconnectionpoints.connectionpointslist.values():
+            connectionpoint.tclconnectionpoint(target)
+
+    def hwtcl(target):
+        generate.emitHwTcl(target, qgenerics, qconnectionpoints, 'hwtclbench', '1.0', 'Qgen', 'Test',
+                           timestamp=False)
+
+    print('{} generics, {} connection points, best of {}'.format(ngenerics, nconnectionpoints, repeat))
+    for label, function in (('parameters', parameters), ('connection points', interfaces), ('_hw.tcl', hwtcl)):
+        duration, text = timed(function, repeat)
+        print('{:>20}: {:8.1f} ms {:10} lines'.format(label, duration * 1000, text.count('\n')))
+
+
+if __name__ == '__main__':
+    # ''' here we add some tests '''
+    parser = argparse.ArgumentParser(prog='qgen hwtclbench')
+    parser.add_argument('-g', '--generics', type=int, default=4000)
+    parser.add_argument('-c', '--connectionpoints', type=int, default=400)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+    benchmark(args.generics, args.connectionpoints, args.repeat)
@@ -0,0 +1,246 @@
+#  This file is part of the Qgen utility, a Python package for
+#  extending the MyHDL package
+#
+#  Copyright (C) 2014-2015 Josy Boelen
+#
+#  The Qgen utility is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public License as
+#  published by the Free Software Foundation; either version 3.0 of the
+#  License, or (at your option) any later version.
+#
+#  This utility is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+'''
+a performance log: one JSON record per line, one line per Qsys-driven invocation
+
+    {"module": "ST_elementswap", "mode": "generate", "parameters": {...},
+     "phases": {"imports": 0.31, "speculation": 0.0001, "convert": 0.12},
+     "peak_kb": 41234, "cache": {"speculation": "hit"}, "messages": [...], ...}
+
+the file is only ever appended to, every record with a single write,
+so several processes can log at once; it is rotated when it grows beyond MAXBYTES
+'''
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import errno
+import threading
+import contextlib
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# rotate the log beyond this size, keeping BACKUPS older ones: name.1, name.2, ...
+MAXBYTES = 4 * 1024 * 1024
+BACKUPS = 3
+
+# a rotation lock older than this many seconds was left behind by a process that died
+LOCKTIMEOUT = 60
+
+
+def stale(lockfile, timeout=LOCKTIMEOUT):
+    ''' as speculate.stale(): the lock file is older than timeout seconds '''
+    try:
+        return os.path.getmtime(lockfile) + timeout < time.time()
+    except OSError:
+        return False
+
+
+def peakmemory():
+    ''' the peak resident memory in kB, or None where the resource module doesn't exist '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Mac OS X reports bytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class ThreadStream(object):
+    ''' stands in for sys.stdout or sys.stderr: writes go to the stream the current thread
+        redirected to, or to the original one
+    '''
+
+    def __init__(self, original):
+        self.original = original
+        self.local = threading.local()
+
+    def target(self):
+        return getattr(self.local, 'stream', None) or self.original
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def __getattr__(self, name):
+        return getattr(self.target(), name)
+
+
+# the redirections in place, guarded by redirectlock
+redirections = [0]
+redirectlock = threading.Lock()
+
+
+@contextlib.contextmanager
+def redirect(stream):
+    ''' sends what this thread prints, to stdout and stderr, to stream,
+        leaving the other threads printing where they did
+    '''
+    with redirectlock:
+        if redirections[0] == 0:
+            sys.stdout, sys.stderr = ThreadStream(sys.stdout), ThreadStream(sys.stderr)
+        redirections[0] += 1
+        stdout, stderr = sys.stdout, sys.stderr
+    previous = getattr(stdout.local, 'stream', None), getattr(stderr.local, 'stream', None)
+    stdout.local.stream = stderr.local.stream = stream
+    try:
+        yield
+    finally:
+        stdout.local.stream, stderr.local.stream = previous
+        with redirectlock:
+            redirections[0] -= 1
+            if redirections[0] == 0:
+                sys.stdout, sys.stderr = stdout.original, stderr.original
+
+
+class PerfLog(object):
+    ''' collects the record of one invocation and writes it to path (None: don't) '''
+
+    def __init__(self, path, module, mode, parameters=None, imports=None, maxbytes=MAXBYTES):
+        ''' imports: the seconds this invocation spent importing, as timed by the caller '''
+        self.path = path
+        self.maxbytes = maxbytes
+        self.record = {'module': module,
+                       'mode': mode,
+                       'pid': os.getpid(),
+                       'time': time.time(),
+                       'parameters': dict(parameters or {}),
+                       'phases': {},
+                       'cache': {},
+                       'messages': []}
+        if imports is not None:
+            self.record['phases']['imports'] = imports
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            phases = self.record['phases']
+            phases[name] = phases.get(name, 0.0) + time.time() - start
+
+    @contextlib.contextmanager
+    def capture(self, enable=True):
+        ''' what this thread prints goes into the record instead of the console '''
+        if not enable:
+            yield
+            return
+        captured = StringIO()
+        with redirect(captured):
+            yield
+        self.record['messages'].extend(captured.getvalue().splitlines())
+
+    def rotate(self):
+        ''' only one process rotates, the others keep on appending '''
+        lockfile = self.path + '.lock'
+        for attempt in range(2):
+            try:
+                lock = os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+                if attempt or not stale(lockfile):
+                    return
+                # whoever held it died while rotating
+                try:
+                    os.remove(lockfile)
+                except OSError:
+                    pass
+        try:
+            # somebody may have rotated in the mean time
+            if os.path.getsize(self.path) > self.maxbytes:
+                for i in range(BACKUPS - 1, 0, -1):
+                    if os.path.exists('{}.{}'.format(self.path, i)):
+                        os.rename('{}.{}'.format(self.path, i), '{}.{}'.format(self.path, i + 1))
+                os.rename(self.path, self.path + '.1')
+        except OSError:
+            # on Windows another process may have the file open, try again next time
+            pass
+        finally:
+            os.close(lock)
+            os.remove(lockfile)
+
+    def write(self):
+        if self.path is None:
+            return
+        self.record['duration'] = time.time() - self.record['time']
+        self.record['peak_kb'] = peakmemory()
+        import json
+        line = (json.dumps(self.record, sort_keys=True) + '\n').encode('utf-8')
+        try:
+            if os.path.getsize(self.path) > self.maxbytes:
+                self.rotate()
+        except OSError:
+            # not there yet
+            pass
+        handle = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(handle, line)
+        finally:
+            os.close(handle)
+
+
+def selftest():
+    ''' records go to a log in a temporary directory, which is rotated, also past a stale lock
+        returns the number of failed checks
+    '''
+    import json
+    import shutil
+    import tempfile
+    directory = tempfile.mkdtemp(prefix='qgen_perflog.')
+    try:
+        path = os.path.join(directory, 'test.perf.jsonl')
+        log = PerfLog(path, 'test', 'generate', {'WIDTH': '8'}, imports=0.5, maxbytes=256)
+        with log.phase('convert'):
+            time.sleep(0.01)
+        with log.capture():
+            print('captured')
+        for _ in range(4):
+            log.write()
+        # a process that died while rotating
+        with open(path + '.lock', 'w'):
+            pass
+        os.utime(path + '.lock', (time.time() - 2 * LOCKTIMEOUT,) * 2)
+        for _ in range(4):
+            log.write()
+        with open(path, 'r') as source:
+            record = json.loads(source.readline())
+        print(json.dumps(record, sort_keys=True))
+        checks = (('imports as timed by the caller', record['phases'].get('imports') == 0.5),
+                  ('convert phase', record['phases'].get('convert', 0.0) >= 0.01),
+                  ('captured messages', record['messages'] == ['captured']),
+                  ('rotated', os.path.exists(path + '.1')),
+                  ('stale lock taken over', not os.path.exists(path + '.lock')))
+        for name, ok in checks:
+            print('{}: {}'.format(name, 'ok' if ok else 'failed'))
+        return len([ok for name, ok in checks if not ok])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    # ''' here we add some tests '''
+    sys.exit(1 if selftest() else 0)
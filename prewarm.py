@@ -0,0 +1,258 @@
+#  This file is part of the Qgen utility, a Python package for
+#  extending the MyHDL package
+#
+#  Copyright (C) 2014-2015 Josy Boelen
+#
+#  The Qgen utility is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public License as
+#  published by the Free Software Foundation; either version 3.0 of the
+#  License, or (at your option) any later version.
+#
+#  This utility is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+'''
+elaborate (and generate) every instance of a Qgen component in a Qsys system, in parallel, ahead of Qsys
+
+    python -m Utilities.Qgen prewarm system.qsys [-s searchdirectory ...] [-j jobs] [--generate [-l VERILOG]]
+
+the .qsys file names the instances and their parameter values,
+the components are found by their Qgen-generated xxx_hw.tcl files
+(in the directory of the .qsys file and below, unless told otherwise)
+we run the very command the Elaborate callback runs, so with an elaborate cache
+(see Qgen's elaboratecache) Qsys' own calls become cache hits
+with --generate every instance is then generated into a temporary directory, with the command
+the Generate callback (or the file set callbacks) runs, so with a generation cache
+(see Qgen's generatecache) Qsys' own Generate calls become cache hits
+'''
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import xml.etree.ElementTree as ElementTree
+from multiprocessing.pool import ThreadPool
+
+import Utilities.Qgen.fastpath as fastpath
+import Utilities.Qgen.qerror as qerror
+
+
+def tclwords(text):
+    ''' splits a line of Tcl into its words, as far as the generated _hw.tcl needs it:
+        plain words and {braced words}, [command substitutions] are kept as they are
+    '''
+    words = []
+    i = 0
+    while i < len(text):
+        if text[i].isspace():
+            i += 1
+            continue
+        if text[i] == '{':
+            depth = 0
+            for j in range(i, len(text)):
+                if text[j] == '{':
+                    depth += 1
+                elif text[j] == '}':
+                    depth -= 1
+                    if depth == 0:
+                        break
+            word = text[i + 1:j]
+            i = j + 1
+        else:
+            # a plain word, up to the first space outside [ ]
+            depth = 0
+            j = i
+            while j < len(text) and (depth or not text[j].isspace()):
+                if text[j] == '[':
+                    depth += 1
+                elif text[j] == ']':
+                    depth -= 1
+                j += 1
+            word = text[i:j]
+            i = j
+        words.append(word)
+    return words
+
+
+class HwTcl(object):
+    ''' what we need to know of a Qgen-generated xxx_hw.tcl to call upon its Elaborate and Generate code '''
+
+    def __init__(self, path):
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self.name = None
+        self.command = None
+        self.inputs = []
+        self.generatecommand = None
+        self.generateinputs = []
+        self.defaults = {}
+        inproc = None
+        with open(path, 'r') as source:
+            for line in source:
+                words = tclwords(line)
+                if words[:2] == ['set_module_property', 'NAME']:
+                    self.name = words[2]
+                elif words[:1] == ['set_parameter_property'] and words[2:3] == ['DEFAULT_VALUE']:
+                    self.defaults[words[1]] = words[3] if len(words) > 3 else ''
+                elif words[:1] == ['proc'] and words[1:2] in (['Elaborate'], ['Generate'], ['QgenFileset']):
+                    inproc = words[1]
+                elif inproc and line.startswith('}'):
+                    inproc = None
+                elif inproc == 'Elaborate' and words[:2] == ['lappend', 'command']:
+                    if '--QsysElaborate' in words:
+                        self.command = [word.replace('[pwd]', self.directory) for word in words[2:]]
+                    elif words[2:3] == ['<<']:
+                        # << [QgenRequest {NAME NAME ...}]
+                        self.inputs = tclwords(tclwords(words[3][1:-1])[1])
+                elif inproc is not None and inproc != 'Elaborate':
+                    if words[:2] == ['lappend', 'command'] and '--QsysGenerate' in words:
+                        # up to --QsysGenerate, the output directory and the name follow
+                        words = words[2:words.index('--QsysGenerate') + 1]
+                        self.generatecommand = [word.replace('[pwd]', self.directory) for word in words]
+                    for word in words:
+                        if word.startswith('[QgenRequest '):
+                            # lappend command << [QgenRequest {NAME NAME ...}], or set request [...]
+                            self.generateinputs = tclwords(tclwords(word[1:-1])[1])
+
+    def elaboratable(self):
+        ''' only the _hw.tcl files that send a qgen/1 request '''
+        return self.command is not None and self.command[-1] == '-'
+
+    def generatable(self):
+        return self.generatecommand is not None and bool(self.generateinputs)
+
+    def elaborate(self, parameters):
+        ''' returns the response as a dictionary and the time it took, in seconds '''
+        values = [(name, parameters.get(name, self.defaults.get(name, ''))) for name in self.inputs]
+        return self.call(self.command, values)
+
+    def generate(self, parameters, outdir, name, language='VHDL'):
+        ''' generates the instance name into outdir, in language (VHDL or VERILOG)
+            parameters: all of them, the derived ones as the elaborate function gave them
+            returns the response as a dictionary and the time it took, in seconds
+        '''
+        command = list(self.generatecommand)
+        # -l $targethdl (or $language)
+        for i, word in enumerate(command[:-1]):
+            if word == '-l':
+                command[i + 1] = language
+        values = [(name, parameters.get(name, self.defaults.get(name, ''))) for name in self.generateinputs]
+        return self.call(command + [outdir, name, '-'], values)
+
+    def call(self, command, values):
+        ''' runs command with the qgen/1 request holding values on stdin '''
+        command = list(command)
+        if command[0].endswith('.py'):
+            # the worker version runs the script in the same way
+            command.insert(0, sys.executable)
+        start = time.time()
+        process = subprocess.Popen(command, cwd=self.directory, universal_newlines=True,
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = process.communicate(fastpath.PROTOCOL + '\n' + fastpath.encode(values))
+        duration = time.time() - start
+        if process.returncode:
+            raise qerror.QError('{} failed: {}'.format(' '.join(command), err.strip()))
+        lines = out.splitlines()
+        if fastpath.PROTOCOL not in lines:
+            raise qerror.QError('Expected a {} response, got {}'.format(fastpath.PROTOCOL, out.strip()))
+        return dict(fastpath.decode(lines[lines.index(fastpath.PROTOCOL) + 1:])), duration
+
+
+def instances(qsysfile):
+    ''' returns (kind, instance name, {parameter: value}) for every module in the .qsys file '''
+    result = []
+    for module in ElementTree.parse(qsysfile).getroot().iter('module'):
+        parameters = dict((parameter.get('name'), parameter.get('value', ''))
+                          for parameter in module.iter('parameter'))
+        result.append((module.get('kind'), module.get('name'), parameters))
+    return result
+
+
+def components(searchdirectories):
+    ''' the Qgen-generated _hw.tcl files below the search directories, by module name '''
+    result = {}
+    for searchdirectory in searchdirectories:
+        for root, _, files in os.walk(searchdirectory):
+            for filename in files:
+                if not filename.endswith('_hw.tcl'):
+                    continue
+                path = os.path.join(root, filename)
+                with open(path, 'r') as source:
+                    if 'generated by' not in source.readline():
+                        continue
+                hwtcl = HwTcl(path)
+                if hwtcl.name is not None:
+                    result.setdefault(hwtcl.name, hwtcl)
+    return result
+
+
+def prewarm(qsysfile, searchdirectories=None, jobs=None, verbose=False, generate=False, language='VHDL'):
+    ''' elaborate every instance of a Qgen component in the system, jobs at a time
+        generate: then generate every instance in language (VHDL or VERILOG) as well, into a temporary directory
+        returns a list of (instance name, response or exception, duration, Generate response or None)
+    '''
+    found = components(searchdirectories or [os.path.dirname(os.path.abspath(qsysfile))])
+    work = []
+    for kind, name, parameters in instances(qsysfile):
+        if kind not in found:
+            continue
+        if not found[kind].elaboratable():
+            print('{}: {} is older than the qgen/1 format, regenerate it'.format(name, found[kind].path))
+            continue
+        work.append((name, found[kind], parameters))
+
+    def run(item):
+        name, hwtcl, parameters = item
+        try:
+            response, duration = hwtcl.elaborate(parameters)
+        except (qerror.QError, OSError) as exc:
+            return name, exc, 0.0, None
+        if not generate or not hwtcl.generatable():
+            return name, response, duration, None
+        # Qsys hands Generate the derived values Elaborate set
+        derived = dict((key, value) for key, value in response.items() if not key.startswith('@'))
+        outdir = tempfile.mkdtemp(prefix='qgen_prewarm.')
+        try:
+            generated, generateduration = hwtcl.generate(dict(parameters, **derived), outdir, name, language)
+        except (qerror.QError, OSError) as exc:
+            return name, exc, duration, None
+        finally:
+            shutil.rmtree(outdir, ignore_errors=True)
+        return name, response, duration + generateduration, generated
+
+    start = time.time()
+    pool = ThreadPool(jobs or None)
+    try:
+        results = pool.map(run, work)
+    finally:
+        pool.close()
+
+    for name, response, duration, generated in results:
+        if isinstance(response, Exception):
+            print('{}: {}'.format(name, response))
+        elif verbose:
+            print('{}: {:.1f} ms, cache {}{}'.format(name, duration * 1000, response.get('@cache', 'not used'),
+                                                     '' if generated is None else ', generation cache {}'
+                                                     .format(generated.get('@generate', 'not used'))))
+    print('{} {} instance(s) in {:.1f} s ({:.1f} s one after the other)'
+          .format('Generated' if generate else 'Elaborated', len(results), time.time() - start,
+                  sum(result[2] for result in results)))
+    if generate and any(generated is not None and '@generate' not in generated for _, _, _, generated in results):
+        print('Generating ahead of Qsys only pays off with a generation cache: Qgen(..., generatecache=...)')
+    return results
+
+
+if __name__ == '__main__':
+    # ''' here we add some tests '''
+    print(tclwords('lappend command {C:/Program Files/python.exe} -E [pwd]/x.py --QsysElaborate -'))
+    print(tclwords('lappend command << [QgenRequest {WIDTH_DQ SWAPS}]'))
@@ -0,0 +1,164 @@
+#  This file is part of the Qgen utility, a Python package for
+#  extending the MyHDL package
+#
+#  Copyright (C) 2014-2015 Josy Boelen
+#
+#  The Qgen utility is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public License as
+#  published by the Free Software Foundation; either version 3.0 of the
+#  License, or (at your option) any later version.
+#
+#  This utility is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+'''
+a long-lived worker answering the Elaborate and Generate callbacks
+(the successor of the pytcl.py prototype)
+
+the _hw.tcl opens it once per Qsys session:
+    open "|python -m Utilities.Qgen.server" r+
+and then keeps on talking to it over the pipe
+so we pay for starting Python and importing MyHDL only once
+
+the protocol is line based:
+    request:    run <n> [<m>]
+                <n> lines: working directory, script, argument 1, argument 2, ...
+                <m> lines the script reads from stdin
+    response:   ok|error <nout> <nerr>
+                <nout> lines of what the script wrote to stdout
+                <nerr> lines of what the script wrote to stderr
+    quit        stops the worker
+
+the _hw.tcl side restarts the worker when the component's .py file changes
+
+    python -m Utilities.Qgen.server --selftest
+runs a few requests through one worker
+'''
+
+from __future__ import print_function
+
+import sys
+import os
+import traceback
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class Worker(object):
+    ''' executes component scripts as if they were started by 'exec python script args' '''
+
+    def __init__(self, channelin, channelout):
+        self.channelin = channelin
+        self.channelout = channelout
+        # compiled scripts, keyed by path, with the modification time they were compiled at
+        self.scripts = {}
+
+    def compiled(self, script):
+        mtime = os.path.getmtime(script)
+        if script not in self.scripts or self.scripts[script][0] != mtime:
+            with open(script, 'r') as source:
+                self.scripts[script] = (mtime, compile(source.read(), script, 'exec'))
+        return self.scripts[script][1]
+
+    def execute(self, cwd, script, args, stdin=''):
+        ''' returns the status and the captured stdout and stderr text '''
+        os.chdir(cwd)
+        scriptdir = os.path.dirname(os.path.abspath(script))
+        if scriptdir not in sys.path:
+            sys.path.insert(0, scriptdir)
+        stdout, stderr, channelin = sys.stdout, sys.stderr, sys.stdin
+        sys.stdout, sys.stderr, sys.stdin = StringIO(), StringIO(), StringIO(stdin)
+        out, err = sys.stdout, sys.stderr
+        sys.argv = [script] + list(args)
+        status = 'ok'
+        try:
+            exec(self.compiled(script), {'__name__': '__main__', '__file__': script})
+        except SystemExit as exc:
+            if exc.code:
+                status = 'error'
+        except Exception:
+            status = 'error'
+            traceback.print_exc(file=err)
+        finally:
+            # the script may have redirected the console to a log-file
+            if sys.stdout is not out and hasattr(sys.stdout, 'close'):
+                sys.stdout.close()
+            sys.stdout, sys.stderr, sys.stdin = stdout, stderr, channelin
+        return status, out.getvalue(), err.getvalue()
+
+    def respond(self, status, out, err):
+        outlines = out.splitlines()
+        errlines = err.splitlines()
+        self.channelout.write('{} {} {}\n'.format(status, len(outlines), len(errlines)))
+        for line in outlines + errlines:
+            self.channelout.write(line + '\n')
+        self.channelout.flush()
+
+    def serve(self):
+        while True:
+            header = self.channelin.readline()
+            if not header or header.strip() == 'quit':
+                break
+
+            command = header.split()
+            if len(command) not in (2, 3) or command[0] != 'run':
+                self.respond('error', 'Unknown request: {}'.format(header.strip()), '')
+                continue
+
+            request = [self.channelin.readline().rstrip('\n') for _ in range(int(command[1]))]
+            stdin = ''.join(self.channelin.readline() for _ in range(int(command[2]) if len(command) > 2 else 0))
+            if len(request) < 2:
+                self.respond('error', 'Incomplete request: {}'.format(request), '')
+                continue
+
+            self.respond(*self.execute(request[0], request[1], request[2:], stdin))
+
+
+def selftest():
+    ''' requests one after the other through one worker must all get their answer:
+        whatever the script writes goes to the sys.stdout of its own request
+    '''
+    import shutil
+    import tempfile
+    directory = tempfile.mkdtemp(prefix='qgen_server.')
+    try:
+        script = os.path.join(directory, 'qgen_selftest.py')
+        with open(script, 'w') as target:
+            target.write('import sys\n'
+                         'import Utilities.Qgen.fastpath as fastpath\n'
+                         "if sys.argv[1] == '--QsysElaborate':\n"
+                         "    fastpath.elaborate(lambda qsysargdict: ('WIDTH', qsysargdict['WIDTH']), sys.argv[2:])\n"
+                         'else:\n'
+                         "    fastpath.respond(('GENERATED', sys.argv[2]))\n")
+        worker = Worker(None, None)
+        failed = 0
+        # Elaborate in the older command line format and in the key/value format on stdin, then Generate
+        for expected, args, stdin in (('8', ['--QsysElaborate', 'WIDTH', '8'], ''),
+                                      ('16', ['--QsysElaborate', 'WIDTH', '16'], ''),
+                                      ('32', ['--QsysElaborate', '-'], 'qgen/1\nWIDTH=32\n'),
+                                      ('64', ['--QsysElaborate', '-'], 'qgen/1\nWIDTH=64\n'),
+                                      ('first', ['--QsysGenerate', 'first'], ''),
+                                      ('second', ['--QsysGenerate', 'second'], '')):
+            status, out, err = worker.execute(directory, script, args, stdin)
+            print('{} {}: {}'.format(status, ' '.join(args), ' '.join(out.split()) or '(no response)'))
+            if status != 'ok' or expected not in out:
+                failed += 1
+        return failed
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--selftest']:
+        # ''' here we add some tests '''
+        sys.exit(1 if selftest() else 0)
+    Worker(sys.stdin, sys.stdout).serve()
+    sys.exit(0)
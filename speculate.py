@@ -0,0 +1,137 @@
+#  This file is part of the Qgen utility, a Python package for
+#  extending the MyHDL package
+#
+#  Copyright (C) 2014-2015 Josy Boelen
+#
+#  The Qgen utility is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public License as
+#  published by the Free Software Foundation; either version 3.0 of the
+#  License, or (at your option) any later version.
+#
+#  This utility is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+'''
+speculative generation
+
+Qsys calls Generate after the last Elaborate of an instance, with the same parameter values
+so the Elaborate callback can start the conversion in the background (--QsysSpeculate)
+and Generate only has to pick up the result, or wait for it
+
+a conversion runs in a directory of its own, in the cache directory, named after
+the generation key (see cache.generationkey), the same key the generation cache uses
+a lock file makes sure only one process converts a given set of parameters
+the results nobody picked up within MAXAGE seconds are removed after every conversion
+'''
+
+from __future__ import print_function
+
+import os
+import time
+import errno
+import shutil
+
+import Utilities.Qgen.cache as cache
+
+# a conversion still running after this many seconds is taken for dead
+TIMEOUT = 600
+
+# a result older than this many seconds is removed by prune(MAXAGE)
+MAXAGE = 3600
+
+
+class Speculation(object):
+    ''' the (future) result of converting the component for one set of parameter values '''
+
+    def __init__(self, key):
+        ''' key: the generation key of the VHDL conversion '''
+        self.directory = os.path.join(cache.directory(), 'speculate', key)
+        self.lockfile = os.path.join(self.directory, 'lock')
+        self.result = os.path.join(self.directory, 'result.vhd')
+
+    def ready(self):
+        return os.path.exists(self.result)
+
+    def acquire(self):
+        ''' returns True if we are the one to convert '''
+        try:
+            os.makedirs(self.directory)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+        if self.stale():
+            # whoever held it, died
+            self.release()
+        try:
+            lock = os.open(self.lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as exc:
+            if exc.errno == errno.EEXIST:
+                return False
+            raise
+        os.write(lock, '{}\n'.format(os.getpid()).encode('utf-8'))
+        os.close(lock)
+        return True
+
+    def release(self):
+        try:
+            os.remove(self.lockfile)
+        except OSError:
+            pass
+
+    def stale(self, timeout=TIMEOUT):
+        return stale(self.lockfile, timeout)
+
+    def publish(self, filename):
+        ''' the converted file becomes the result, in one go '''
+        os.rename(filename, self.result)
+
+    def wait(self, timeout=TIMEOUT):
+        ''' returns True when the result is there, waiting for a conversion still running '''
+        while not self.ready() and os.path.exists(self.lockfile) and not self.stale(timeout):
+            time.sleep(0.1)
+        return self.ready()
+
+    def fetch(self, filename, copy=shutil.copyfile):
+        copy(self.result, filename)
+
+
+def stale(lockfile, timeout=TIMEOUT):
+    try:
+        return os.path.getmtime(lockfile) + timeout < time.time()
+    except OSError:
+        return False
+
+
+def age(path):
+    ''' seconds since path was last modified, 0 if it is gone '''
+    try:
+        return time.time() - os.path.getmtime(path)
+    except OSError:
+        return 0
+
+
+def prune(maxage=0):
+    ''' remove the speculative conversions that are done (or dead) since more than maxage seconds,
+        returns how many
+    '''
+    root = os.path.join(cache.directory(), 'speculate')
+    removed = 0
+    if not os.path.isdir(root):
+        return removed
+    for name in os.listdir(root):
+        directory = os.path.join(root, name)
+        lockfile = os.path.join(directory, 'lock')
+        if os.path.exists(lockfile) and not stale(lockfile):
+            continue
+        result = os.path.join(directory, 'result.vhd')
+        if age(result if os.path.exists(result) else directory) <= maxage:
+            continue
+        shutil.rmtree(directory, ignore_errors=True)
+        removed += 1
+    return removed
@@ -0,0 +1,248 @@
+#  This file is part of the Qgen utility, a Python package for
+#  extending the MyHDL package
+#
+#  Copyright (C) 2014-2015 Josy Boelen
+#
+#  The Qgen utility is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public License as
+#  published by the Free Software Foundation; either version 3.0 of the
+#  License, or (at your option) any later version.
+#
+#  This utility is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+'''
+a stress test for building in threads: simulate, convert and write the _hw.tcl
+of many parameter variants of a small component, one after the other and then all at once,
+every variant twice with the same Qgen object, and compare the results
+
+    python -m Utilities.Qgen.stresstest [-n variants] [-j threads]
+'''
+
+from __future__ import print_function
+
+import os
+import sys
+import shutil
+import tempfile
+import argparse
+from multiprocessing.pool import ThreadPool
+
+import myhdl
+
+import Utilities.Qgen.Qgen as Qgen
+import Utilities.Qgen.perflog as perflog
+
+MODULENAME = 'qgen_stress'
+
+
+def qgen_stress(WIDTH_D, Clk, Reset, DData, DValid, DReady, QData, QValid, QReady):
+    ''' registers the data, inverted '''
+
+    @myhdl.always_seq(Clk.posedge, reset=Reset)
+    def rtlreg():
+        if QReady:
+            QData.next = ~DData
+            QValid.next = DValid
+
+    @myhdl.always_comb
+    def rtlready():
+        DReady.next = QReady
+
+    return rtlreg, rtlready
+
+
+def signals(q):
+    Clk = myhdl.Signal(bool(0))
+    Reset = myhdl.ResetSignal(0, active=1, async=True)
+    DData, _, _, _, _, _, DValid, DReady = q.makesignals('In')
+    QData, _, _, _, _, _, QValid, QReady = q.makesignals('Out')
+    return Clk, Reset, DData, DValid, DReady, QData, QValid, QReady
+
+
+def tb_qgen_stress(q):
+    Clk, Reset, DData, DValid, DReady, QData, QValid, QReady = signals(q)
+    dut = qgen_stress(q.genericvalue('WIDTH_D'), Clk, Reset, DData, DValid, DReady, QData, QValid, QReady)
+
+    @myhdl.always(myhdl.delay(5))
+    def clkgen():
+        Clk.next = not Clk
+
+    @myhdl.instance
+    def stimulus():
+        Reset.next = 1
+        yield Clk.posedge
+        Reset.next = 0
+        QReady.next = 1
+        for i in range(2 ** min(len(DData), 4)):
+            DData.next = i
+            DValid.next = 1
+            yield Clk.posedge
+        raise myhdl.StopSimulation
+
+    return dut, clkgen, stimulus
+
+
+def convert(q, targethdl):
+    Clk, Reset, DData, DValid, DReady, QData, QValid, QReady = signals(q)
+    converter = myhdl.toVHDL if targethdl == 'vhdl' else myhdl.toVerilog
+    converter(qgen_stress, q.genericvalue('WIDTH_D'), Clk, Reset, DData, DValid, DReady, QData, QValid, QReady)
+
+
+def elaborate(qsysargdict):
+    width = int(qsysargdict['WIDTH_D'])
+    return 'WIDTH_Q', width, 'LATENCY', 1
+
+
+def component(width, **options):
+    ''' the variant with WIDTH_D width, described only: main() does the work '''
+    return Qgen.Qgen(MODULENAME,
+                     (('WIDTH_D', ('Natural', width, (1, 64))),
+                      ('WIDTH_Q', ('Natural', width), True),
+                      ('LATENCY', ('Natural', 1), True),
+                      ('SYMBOLS', ('Natural', 1), ('(WIDTH_D + 7) / 8', 'SYMBOLS > 0'))),
+                     (('Clock', ('Clk', 0)),
+                      ('Reset', ('Reset', 'Clk', 'DEASSERT')),
+                      ('Sink', ('In', ('Clk', 'Reset'), ('D', 'WIDTH_D'), (True,))),
+                      ('Source', ('Out', ('Clk', 'Reset'), ('Q', 'WIDTH_Q'), (True,)))),
+                     testbench=(1000, tb_qgen_stress),
+                     convert=convert,
+                     elaborate=elaborate,
+                     gentcl=('1.0', 'Qgen', 'Test', {'timestamp': False}),
+                     autorun=False,
+                     **options)
+
+
+def buildone(q, directory):
+    ''' builds q into directory, returns what it printed '''
+    os.makedirs(directory)
+    q.directory = directory
+    log = perflog.PerfLog(None, MODULENAME, 'build')
+    with log.capture():
+        status = q.main([])
+        q.show()
+    return log.record['messages'] + ([] if status == 0 else ['main() returned {}'.format(status)])
+
+
+def hwtclone(q, directory):
+    ''' writes the _hw.tcl of q, already built, again into directory '''
+    os.makedirs(directory)
+    q.GenTcl(q.gentcl[:3] + (dict(q.gentcl[3], directory=directory),))
+    return []
+
+
+def contents(directory):
+    ''' the files in directory, without the lines holding a date or the directory '''
+    result = {}
+    for filename in sorted(os.listdir(directory)):
+        lines = []
+        skip = False
+        with open(os.path.join(directory, filename), 'r') as source:
+            for line in source:
+                # the VCD file has its date in a $date ... $end section
+                if line.startswith('$date'):
+                    skip = True
+                if not skip and 'Date:' not in line and 'File:' not in line:
+                    lines.append(line)
+                if line.startswith('$end'):
+                    skip = False
+        result[filename] = lines
+    return result
+
+
+def stresstest(variants=8, jobs=8, verbose=False):
+    ''' returns the number of builds that differ from their serial counterpart '''
+    widths = [i % 64 + 1 for i in range(variants)]
+    components = [component(width) for width in widths]
+    root = tempfile.mkdtemp(prefix='qgen_stress.')
+    try:
+        serial = [buildone(q, os.path.join(root, 'serial', str(i))) for i, q in enumerate(components)]
+
+        # every variant built again, and the _hw.tcl of the serial ones written twice more, all at once
+        work = [(i, kind) for i in range(variants) for kind in ('build', 'hwtcl0', 'hwtcl1')]
+
+        def build(job):
+            i, kind = job
+            directory = os.path.join(root, kind, str(i))
+            if kind == 'build':
+                return buildone(component(widths[i]), directory)
+            return hwtclone(components[i], directory)
+
+        pool = ThreadPool(jobs)
+        try:
+            results = pool.map(build, work, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+        failed = 0
+        for (i, kind), messages in zip(work, results):
+            expected = contents(os.path.join(root, 'serial', str(i)))
+            actual = contents(os.path.join(root, kind, str(i)))
+            if kind != 'build':
+                expected = {name: lines for name, lines in expected.items() if name.endswith('_hw.tcl')}
+                messages = serial[i]
+            if messages != serial[i] or actual != expected:
+                failed += 1
+                print('WIDTH_D {} ({}): differs from the serial build'.format(widths[i], kind))
+                if verbose:
+                    for filename in sorted(set(expected) | set(actual)):
+                        if expected.get(filename) != actual.get(filename):
+                            print('    {}'.format(filename))
+                    if messages != serial[i]:
+                        print('    show()')
+        print('{} variant(s), {} parallel build(s) in {} thread(s): {} differ(s)'
+              .format(variants, len(work), jobs, failed))
+        return failed
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def sharedentity(width=8):
+    ''' two identical instances, generated as the file set callbacks do: each into a temporary
+        directory of its own, must share one entity, returns 1 if they don't
+    '''
+    root = tempfile.mkdtemp(prefix='qgen_shared.')
+    qgencache = os.environ.get('QGEN_CACHE')
+    os.environ['QGEN_CACHE'] = os.path.join(root, 'cache')
+    try:
+        outcomes, files = [], []
+        for instance in ('instance_a', 'instance_b'):
+            outdir = os.path.join(root, instance)
+            os.makedirs(outdir)
+            q = component(width, sharedentity=True)
+            log = perflog.PerfLog(None, MODULENAME, 'build')
+            with log.capture():
+                q.main(['-l', 'VHDL', '--sharedfiles', '--QsysGenerate', outdir, instance, 'WIDTH_D', str(width)])
+            outcomes.append(q.log.record['cache'].get('entity', 'converted'))
+            files.append(q.generated['files'].split())
+            if not os.path.exists(os.path.join(outdir, '{}.vhd'.format(instance))):
+                outcomes.append('no wrapper')
+        entities = [name for name in files[0] if os.path.basename(name).startswith(MODULENAME)]
+        failed = outcomes != ['converted', 'shared'] or files[0] != files[1] or len(entities) != 1 \
+            or not os.path.exists(entities[0])
+        print('sharedentity: {} and {}, {}'.format(outcomes[0], ', '.join(outcomes[1:]),
+                                                    'one entity' if not failed else 'not shared'))
+        return 1 if failed else 0
+    finally:
+        if qgencache is None:
+            del os.environ['QGEN_CACHE']
+        else:
+            os.environ['QGEN_CACHE'] = qgencache
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    # ''' here we add some tests '''
+    parser = argparse.ArgumentParser(prog='qgen stresstest')
+    parser.add_argument('-n', '--variants', type=int, default=8)
+    parser.add_argument('-j', '--jobs', type=int, default=8)
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+    sys.exit(1 if stresstest(args.variants, args.jobs, args.verbose) + sharedentity() else 0)
@@ -0,0 +1,66 @@
+#  This file is part of the Qgen utility, a Python package for
+#  extending the MyHDL package
+#
+#  Copyright (C) 2014-2015 Josy Boelen
+#
+#  The Qgen utility is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public License as
+#  published by the Free Software Foundation; either version 3.0 of the
+#  License, or (at your option) any later version.
+#
+#  This utility is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+'''
+the Tcl templates: lists of lines with _name_ placeholders, compiled once into a format string
+
+    CLOCK = Template(['add_interface _clk_ clock end\\n',
+                      'set_interface_property _clk_ clockRate _clockrate_\\n'], 'clk', 'clockrate')
+    CLOCK.write(tcltarget, clk='Clk', clockrate=0)
+
+a placeholder is replaced wherever it occurs, also inside a longer name: _this__filesets
+'''
+
+from __future__ import print_function
+
+
+class Template(object):
+    ''' lines with the placeholders _name_ for every name given '''
+
+    def __init__(self, lines, *names):
+        # the Tcl braces are literal text for str.format
+        text = ''.join(lines).replace('{', '{{').replace('}', '}}')
+        for name in names:
+            text = text.replace('_{}_'.format(name), '{' + name + '}')
+        self.text = text
+        self.render = text.format
+
+    def write(self, target, **values):
+        ''' renders into target: anything with a write() '''
+        target.write(self.text.format(**values))
+
+
+class Buffer(object):
+    ''' an in-memory file to render into, written out in one call with getvalue() '''
+
+    def __init__(self):
+        self.parts = []
+        self.write = self.parts.append
+
+    def getvalue(self):
+        return ''.join(self.parts)
+
+
+if __name__ == '__main__':
+    # ''' here we add some tests '''
+    proc = Template(['proc _proc_ {_arguments_} {\n', '\tglobal _proc__table\n'], 'proc', 'arguments')
+    buffer = Buffer()
+    proc.write(buffer, proc='Elaborate', arguments='')
+    proc.write(buffer, proc='QgenFileset', arguments='entityname language')
+    print(buffer.getvalue())
@@ -0,0 +1,140 @@
+#  This file is part of the Qgen utility, a Python package for
+#  extending the MyHDL package
+#
+#  Copyright (C) 2014-2015 Josy Boelen
+#
+#  The Qgen utility is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public License as
+#  published by the Free Software Foundation; either version 3.0 of the
+#  License, or (at your option) any later version.
+#
+#  This utility is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+'''
+watch mode: which stages a change to the sources affects
+
+    python component.py --watch
+
+the component source is compared function by function:
+    the elaborate function      -> hwtcl (and the elaborate cache is cleared)
+    the testbench               -> simulate
+    the convert function        -> vhdl, verilog
+    any other function (the DUT) -> simulate, vhdl, verilog
+    the rest (the Qgen(...) call, generics, connection points) -> everything
+a helper module holding the elaborate function counts as the elaborate function,
+another one as the DUT, and a change in the Qgen package affects everything
+'''
+
+from __future__ import print_function
+
+import os
+import ast
+import time
+
+# seconds between looking at the files
+INTERVAL = 0.5
+
+STAGES = ('simulate', 'vhdl', 'verilog', 'hwtcl')
+
+
+def functions(filename):
+    ''' the source text of the outermost functions in filename, by name, and under None the rest of it
+        raises SyntaxError while the file is half edited
+    '''
+    with open(filename, 'r') as source:
+        text = source.read()
+    lines = text.splitlines()
+    tree = ast.parse(text, filename)
+    result = {}
+    covered = set()
+
+    def visit(node):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.FunctionDef):
+                first = min([child.lineno] + [decorator.lineno for decorator in child.decorator_list])
+                last = max(getattr(descendant, 'lineno', first) for descendant in ast.walk(child))
+                result[child.name] = '\n'.join(lines[first - 1:last])
+                covered.update(range(first - 1, last))
+            else:
+                visit(child)
+
+    visit(tree)
+    result[None] = '\n'.join(line for i, line in enumerate(lines) if i not in covered)
+    return result
+
+
+def affected(old, new, elaborate=None, testbench=None, convert=None):
+    ''' the stages affected going from old to new, both as returned by functions(),
+        and whether the elaborate function changed
+        elaborate, testbench, convert: the names of those functions
+    '''
+    changed = set(name for name in set(old) | set(new) if old.get(name) != new.get(name))
+    if None in changed:
+        return set(STAGES), elaborate is not None
+    stages = set()
+    for name in changed:
+        if name == elaborate:
+            stages.add('hwtcl')
+        elif name == testbench:
+            stages.add('simulate')
+        elif name == convert:
+            stages.update(['vhdl', 'verilog'])
+        else:
+            stages.update(['simulate', 'vhdl', 'verilog'])
+    return stages, elaborate in changed
+
+
+class Watcher(object):
+    ''' remembers the modification times of files, and the functions in the component source '''
+
+    def __init__(self, script, files):
+        self.script = os.path.abspath(script)
+        self.mtimes = {}
+        self.update(files)
+        self.functions = functions(self.script)
+
+    def update(self, files):
+        for filename in files:
+            self.mtimes[filename] = self.mtime(filename)
+
+    @staticmethod
+    def mtime(filename):
+        try:
+            return os.path.getmtime(filename)
+        except OSError:
+            # being saved, or gone
+            return None
+
+    def changed(self):
+        ''' the files modified since the last call, an empty list if none '''
+        result = [filename for filename, mtime in self.mtimes.items() if self.mtime(filename) != mtime]
+        if result:
+            # an editor may save in several steps
+            time.sleep(INTERVAL)
+            self.update(result)
+        return sorted(result)
+
+    def wait(self):
+        ''' returns the files modified, as soon as there are any '''
+        while True:
+            result = self.changed()
+            if result:
+                return result
+            time.sleep(INTERVAL)
+
+
+if __name__ == '__main__':
+    # ''' here we add some tests '''
+    before = functions(__file__)
+    after = dict(before, affected='def affected(): pass')
+    print(sorted(name for name in before if name is not None))
+    print(affected(before, after, elaborate='affected'))
+    print(affected(before, after, testbench='affected'))
+    print(affected(before, dict(after, **{None: ''})))